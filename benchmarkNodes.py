@@ -0,0 +1,72 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from planit import Planit
+
+# Node creation benchmark: memory per search node and nodes created per second
+# Builds synthetic vars like ObsPlanner.createDecisionVars() (sN.tick names, cmd -> gp list choices) and expands a
+# beam-like tree with Planit.createAssignedChild() (no propagation, so only the node representation is measured)
+# usage: python benchmarkNodes.py [nodeCount] [varCount]
+
+def createPlanner(varCount, seed=1):
+    rng = random.Random(seed)
+    planner = Planit()
+    for i in range(varCount):
+        satId = i % 3 + 1
+        tick = i // 3 * 7
+        choices = {}
+        for j in range(rng.randint(1, 4)):
+            cmd = rng.choice("LP") + "." + str(rng.randint(14, 49))
+            choices[cmd] = sorted(rng.sample(range(1, 5000), rng.randint(1, 5)))
+        planner.addVar("s" + str(satId) + "." + str(tick), choices)
+    planner.setInitialState(createInitialState())
+    return planner
+
+
+def createInitialState():
+    try:
+        from node import NodeState
+        return NodeState()
+    except ImportError:
+        return {}
+
+
+def expandNodes(planner, nodeCount, branching=3):
+    # each level expands the first open node with up to branching choices of its frontier var
+    nodes = []
+    parent = planner.rootNode
+    while len(nodes) < nodeCount and parent.unassignedVars:
+        var = parent.unassignedVars[0]
+        children = []
+        for choice in list(var.choices.items())[:branching]:
+            children.append(planner.createAssignedChild(parent, var, choice))
+        nodes.extend(children)
+        parent = children[0]
+    return nodes
+
+
+def main():
+    nodeCount = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    varCount = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+
+    planner = createPlanner(varCount)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    nodes = expandNodes(planner, nodeCount)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print("nodes: "+str(len(nodes))+", bytes/node: "+format(allocated / len(nodes), '.0f'))
+    del nodes
+
+    planner = createPlanner(varCount)
+    startTime = time.perf_counter()
+    nodes = expandNodes(planner, nodeCount)
+    elapsed = time.perf_counter() - startTime
+    print("nodes/s: "+format(len(nodes) / elapsed, '.0f')+" ("+format(elapsed, '.3f')+" s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import struct
+import threading
+
+# Binary search checkpoints (see Planit.writeCheckpoint() and Planit.resumeFromCheckpoint())
+# A checkpoint stores the assignments leading to each open node and to the incumbent, not the nodes:
+#   header
+#   string table:  var names and choice keys (u16 length + utf-8)
+#   chain records: (parent record, var string, choice string), record 0 is the root. The chains of all saved
+#                  nodes form a trie, so shared plan prefixes are stored once. A record without a var
+#                  (NO_VAR) is a start node, its choice field is its index in the parent's children.
+#   open records:  chain record, discrepancies, frontier var string and the frontier var's remaining choices
+# All integers are little endian.
+
+MAGIC = b"PLCK"
+VERSION = 1
+NO_VAR = 0xFFFFFFFF
+HEADER = struct.Struct("<4sHHIIIIid") # magic, version, flags, nodeCount, strings, chains, open nodes, incumbent, elapsed
+CHAIN = struct.Struct("<III")         # parent, var, choice
+OPEN = struct.Struct("<IHIH")         # chain, discrepancies, frontier var, frontier choice count
+STRING_LENGTH = struct.Struct("<H")
+INDEX = struct.Struct("<I")
+
+
+def packCheckpoint(snapshot):
+    # snapshot: dict from Planit.createCheckpointSnapshot()
+    incumbent = snapshot["incumbent"] if snapshot["incumbent"] is not None else -1
+    parts = [HEADER.pack(MAGIC, VERSION, 0, snapshot["nodeCount"], len(snapshot["strings"]), len(snapshot["chains"]),
+                         len(snapshot["openNodes"]), incumbent, snapshot["elapsed"])]
+    for string in snapshot["strings"]:
+        data = string.encode("utf-8")
+        parts.append(STRING_LENGTH.pack(len(data)))
+        parts.append(data)
+    for chain in snapshot["chains"]:
+        parts.append(CHAIN.pack(*chain))
+    for chainId, discrepancies, frontierVar, frontierChoices in snapshot["openNodes"]:
+        parts.append(OPEN.pack(chainId, min(discrepancies, 0xFFFF), frontierVar, len(frontierChoices)))
+        for choice in frontierChoices:
+            parts.append(INDEX.pack(choice))
+    return b"".join(parts)
+
+
+def readCheckpoint(filepath):
+    with open(filepath, "rb") as f:
+        data = f.read()
+    magic, version, flags, nodeCount, stringCount, chainCount, openCount, incumbent, elapsed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        print("readCheckpoint() ERROR! not a checkpoint file (version "+str(VERSION)+"): "+str(filepath))
+        return None
+    offset = HEADER.size
+    strings = []
+    for i in range(stringCount):
+        length = STRING_LENGTH.unpack_from(data, offset)[0]
+        offset += STRING_LENGTH.size
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    chains = []
+    for i in range(chainCount):
+        chains.append(CHAIN.unpack_from(data, offset))
+        offset += CHAIN.size
+    openNodes = []
+    for i in range(openCount):
+        chainId, discrepancies, frontierVar, choiceCount = OPEN.unpack_from(data, offset)
+        offset += OPEN.size
+        frontierChoices = [INDEX.unpack_from(data, offset + j * INDEX.size)[0] for j in range(choiceCount)]
+        offset += choiceCount * INDEX.size
+        openNodes.append((chainId, discrepancies, frontierVar, frontierChoices))
+    return {"nodeCount": nodeCount, "strings": strings, "chains": chains, "openNodes": openNodes,
+            "incumbent": incumbent if incumbent >= 0 else None, "elapsed": elapsed}
+
+
+class CheckpointWriter:
+    # packs and writes snapshots in a background thread. The file is replaced atomically (write temp file + rename)
+    # so a crash during a write leaves the previous checkpoint intact
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.thread = None
+        self.writeCount = 0
+        self.error = None
+
+    def isBusy(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def write(self, snapshot):
+        # returns False (snapshot dropped) if the previous write is still running
+        if self.isBusy():
+            return False
+        self.thread = threading.Thread(target=self.writeFile, args=(snapshot,), daemon=True)
+        self.thread.start()
+        return True
+
+    def writeFile(self, snapshot):
+        tempPath = self.filepath + ".tmp"
+        try:
+            data = packCheckpoint(snapshot)
+            with open(tempPath, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tempPath, self.filepath)
+            self.writeCount += 1
+        except OSError as e:
+            self.error = e
+            print("CheckpointWriter.writeFile() ERROR! "+str(e))
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
@@ -1,11 +1,12 @@
 import ast
-import math
 import random
 import gc
+import numpy
 from datetime import datetime
 from os import path
 from ortools.linear_solver import pywraplp
 from gp import GP
+import slewModel
 
 class ObservationPlanner:
 
@@ -107,47 +108,35 @@ class ObservationPlanner:
             self.createMutexConstraintsForSat(satId)
 
     def createMutexConstraintsForSat(self, satId):
+        # var2 conflicts with var1 if it starts before var1's obs end (+2), slew and next cmd start (+1)
+        # the slew ticks of var1 to every var2 in its window come from one SlewModel.slewTicks lookup
         startTime = datetime.now()
         startTimestamp = startTime.strftime("%m/%d/%Y %H:%M:%S")
         maxSlewTime = 22
         xVars = self.xVars[satId]
         xVarKeys = list(xVars.keys())
+        ticks = numpy.array([int(var[0]) for var in xVarKeys], dtype=numpy.int64)
+        angles = numpy.array([int(var[-1].split(".")[-1]) for var in xVarKeys], dtype=numpy.intp)
+        slewTicks = self.slewModel.slewTicks
         mutexCount = 0
-        v1Index = 0
         print("createMutexConstraintsForSat() s"+str(satId) + ", start: "+startTimestamp+" xVars: "+str(len(xVarKeys)))
-        for var1 in xVarKeys:
-            v1Index += 1
-            v2Count = 0
-            tick1 = int(var1[0])
-            cmd1 = var1[-1]
-            terms1 = cmd1.split(".")
-            angle1 = int(terms1[-1])
-            v2Keys = xVarKeys[v1Index:] # v2 list starts after v1 (v1Index already incremented for this loop)
-            if v1Index % 1000 == 0:
-                print("\nv1Index: "+str(v1Index)+", v2Index count: "+str(len(v2Keys)))
-            for var2 in v2Keys:
-                v2Count += 1
-                if var1 != var2:
-                    tick2 = int(var2[0])
-                    if tick2 > tick1 + 2 + maxSlewTime:
-                        # print("done checking for conflicts for: "+str(var1)+", var2: "+str(var2))
-                        break
-                    else:
-                        cmd2 = var2[-1]
-                        terms2 = cmd2.split(".")
-                        angle2 = int(terms2[-1])
-                        if tick1 <= tick2: # and angle1 != angle2:
-                            if v1Index % 1000 == 0:
-                                print("v1Index: "+str(v1Index)+": v1: "+str(var1)+", v2: "+str(var2))
-                            [slewTime, slewEnergy] = self.getSlewTimeAndEnergy(angle1, angle2)
-                            if tick2 - tick1 < 3 + slewTime:
-                                v1 = xVars[var1]
-                                v2 = xVars[var2]
-                                consName = "c1."+str(v1)+"."+str(v2)
-                                self.solver.Add(v1 + v2 <= 1, consName)
-                                mutexCount += 1
-                        else:
-                            print("createMutexConstraintsForSat() ERROR! Tick 2 "+str(tick2)+ " < Tick 1 "+str(tick1))
+        for v1Index, var1 in enumerate(xVarKeys):
+            tick1 = ticks[v1Index]
+            # v2 list starts after v1, up to the last tick a slew from v1 can reach (xVarKeys are in tick order)
+            v2Start = v1Index + 1
+            v2End = max(v2Start, numpy.searchsorted(ticks, tick1 + 2 + maxSlewTime, side="right"))
+            if (v1Index + 1) % 1000 == 0:
+                print("\nv1Index: "+str(v1Index + 1)+", v2Index count: "+str(len(xVarKeys) - v2Start))
+            tick2s = ticks[v2Start:v2End]
+            for k in numpy.nonzero(tick2s < tick1)[0]:
+                print("createMutexConstraintsForSat() ERROR! Tick 2 "+str(tick2s[k])+ " < Tick 1 "+str(tick1))
+            conflicts = (tick2s >= tick1) & (tick2s - tick1 < 3 + slewTicks[angles[v1Index], angles[v2Start:v2End]])
+            v1 = xVars[var1]
+            for k in numpy.nonzero(conflicts)[0]:
+                v2 = xVars[xVarKeys[v2Start + k]]
+                consName = "c1."+str(v1)+"."+str(v2)
+                self.solver.Add(v1 + v2 <= 1, consName)
+                mutexCount += 1
 
         endTime = datetime.now()
         endTimestamp = endTime.strftime("%m/%d/%Y %H:%M:%S")
@@ -420,6 +409,7 @@ class ObservationPlanner:
         del self.satEclipses
         del self.errorTable
         del self.slewTable
+        del self.slewModel
         print("deletePreprocessingData() calling GC "+self.timestampNow())
         gc.collect()
         print("deletePreprocessingData() done "+self.timestampNow())
@@ -615,34 +605,11 @@ class ObservationPlanner:
         self.satEvents[satId] = horizonEvents
 
     def readSlewTable(self):
-        filename = self.dataPath + "slewTable.txt"
-        print("Reading Slew Table")
-        with open(filename, "r") as f:
-            firstLine = True
-            for line in f:
-                if firstLine:
-                    firstLine = False
-                else:
-                    terms = line.split(",")
-                    poFrom = int(terms[0].strip())
-                    poTo = int(terms[1].strip())
-                    time = float(terms[2].strip())
-                    energy = float(terms[3].strip())
-                    if not poFrom in self.slewTable:
-                        self.slewTable[poFrom] = {}
-                    col = self.slewTable[poFrom]
-                    col[poTo] = [time, energy]
-        tableKeys = list(self.slewTable.keys())
-        colCount = len(tableKeys)
-        firstCol = self.slewTable[tableKeys[0]]
-        rowCount = len(firstCol.keys())
-        print("  slew table size: "+str(rowCount)+" x "+str(colCount))
+        self.slewModel = slewModel.SlewModel(self.dataPath + "slewTable.txt")
+        self.slewTable = self.slewModel.slewTable
 
     def getSlewTimeAndEnergy(self, fromAngle, toAngle):
-        slewTableRow = self.slewTable[fromAngle]
-        slewTime, slewEnergy = slewTableRow[toAngle]
-        slewTimeCeil = math.ceil(slewTime)
-        return (slewTimeCeil, slewEnergy)
+        return self.slewModel.getSlewTimeAndEnergy(fromAngle, toAngle)
 
     def getChoiceCombos(self, choices):
         singleCmds = []
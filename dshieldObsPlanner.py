@@ -1,15 +1,19 @@
 import ast
+import collections
+import bisect
 import datetime
 from planit import Planit
+from node import NodeState
+from var import Var
 from gp import GP
 import time
 import os
-from decimal import Decimal
 import dshieldUtil
-import math
+import slewModel
 import json
-import copy
-import gc
+import multiprocessing
+import queue
+import random
 
 def main():
 
@@ -30,6 +34,12 @@ def main():
     print(obsPlanner.printStats())
     print("main done")
 
+# rollout processes are forked from the planner, they find it here (see ObsPlanner.initRollouts())
+rolloutPlanner = None
+
+def runRolloutTask(task):
+    return rolloutPlanner.runRollout(*task)
+
 
 class ObsPlanner:
     def __init__(self, satList, inputFileDate, horizonId, experimentRun, maxTick, strategy):
@@ -42,15 +52,9 @@ class ObsPlanner:
         # self.demoDataPath = "/Users/richardlevinson/DshieldDemoData2022_Run3/"
         # config params (set in start())
         # planner config params
-        beamwidth = 1
-        if strategy.startswith("beam"):
-            terms = strategy.split(".")
-            strategy = terms[0]
-            beamwidth = int(terms[1])
-        elif strategy != "dfs":
-            print("ERROR! Invalid strategy: "+str(strategy))
+        self.planner = Planit()
+        if not self.setSearchStrategy(strategy):
             return
-        self.nodeSorterHeuristic = strategy #"beam" #"dfs"
         self.valSelectorHeuristic = "maxErrReduction" #"maxGpCount" #"gpRankedChoice" #"maxErrReduction" #"maxErrReduction" # "maxGpCount" #maxGpRankedChoice #"minGpChoiceErr"  #"maxGpChoiceScore" #"maxGpCount" #maxChoiceScore"
         self.horizonDur = 21600
         self.experimentRun = experimentRun
@@ -58,12 +62,53 @@ class ObsPlanner:
         self.usePriorObsFromRun1 = True
         self.useSortedGP = False
         self.sortedGPpct = 0.15
-        self.planner = Planit()
-        self.planner.nodeBeamWidth = beamwidth
         self.fixedPointingOption = False
         self.voteLogging = False
         self.gapPlanningEnabled = False
         self.multipleRootNodes = False
+        # parallel search (forked worker processes, see solveItPortfolio()):
+        #   None:           single search in this process
+        #   "rootChildren": one worker per open root child (requires multipleRootNodes)
+        #   "portfolio":    one worker per config in portfolioConfigs
+        #   "windows":      horizon cut into windowCount time windows at access gaps, one worker per window (see solveItWindows())
+        self.parallelSearch = None
+        self.windowCount = None # None = os.cpu_count()
+        self.portfolioConfigs = [{"strategy": "dfs"}, {"strategy": "beam.2"}, {"strategy": "beam.3"}, {"strategy": "beam.3", "valSelectorHeuristic": "maxGpCount"}]
+        self.portfolioWorkers = None # None = os.cpu_count()
+        # branch and bound: close nodes whose planReward + reward bound can't beat the incumbent (see createRewardBounds())
+        self.boundPruning = False
+        self.rewardBoundTicks = {} # satId -> sorted var ticks
+        self.rewardBoundSums = {}  # satId -> suffix sums of the best choice reward of each var (same order as ticks)
+        self.gpBoundTicks = []     # sorted var ticks (all sats)
+        self.gpBoundSums = []      # sum over gp of the gp's best reward at or after each tick (same order as gpBoundTicks)
+        # transposition table: merge nodes that reach the same search state (see getSearchStateKey())
+        self.useTranspositionTable = False
+        self.gpZobristKeys = {} # gpi -> random 64 bit key, the state's gpHash is the xor of the keys of its observed gps
+        self.zobristRandom = random.Random(0)
+        # monte carlo tree search rollouts (strategy "mcts.N", see runRollout())
+        self.rolloutDepth = None     # vars visited by a rollout (None = rest of the horizon)
+        self.rolloutRandomRate = 0.1 # probability of not taking the best choice in a rollout step
+        self.rolloutWorkers = None   # None or 1 = rollouts run in this process (always with parallelSearch)
+        self.rolloutPool = None
+        self.rolloutVars = []        # root vars (tick order), rollouts filter observed gps themselves
+        self.rolloutTicks = []
+        self.rolloutChoiceRewards = {} # var name -> [(cmd, [(gpi, reward)])]
+        self.rolloutContexts = {}    # node id -> (observed gps, last obs (tick, cmd) per sat)
+        self.rolloutCount = 0
+        # checkpoints: the search frontier is saved every checkpointMinutes to checkpointPath (binary, see checkpoint.py)
+        # set resumeCheckpoint to a checkpoint file to continue that search (same data and settings)
+        self.checkpointPath = None
+        self.checkpointMinutes = 10
+        self.resumeCheckpoint = None
+        self.keepFullTree = False  # keep every search node (Planit drops closed subtrees that aren't needed, see Planit.collectGarbage())
+        self.nodeMemoryLimit = None # > 0: search nodes kept in memory, other nodes are spilled to nodeSpillPath (see nodeStore.py)
+        self.nodeSpillPath = None   # SQLite file for spilled nodes (None = temporary file, parallel workers add ".<worker id>")
+        self.logIncumbents = False # print every improved incumbent while searching (see Planit.iterIncumbents())
+        # anytime search budgets (None = search until the plan is complete)
+        # when a budget is reached the best partial plan found so far (incumbent) is used
+        self.timeLimitMinutes = None
+        self.nodeLimit = None
+        self.memoryLimitMB = None
 
         self.satList = satList
         self.inputFileDate = inputFileDate
@@ -118,6 +163,25 @@ class ObsPlanner:
         self.maxAccessGP = None
         self.removedChoices = 0
         self.removedVars = 0
+        # lazy vars: createDecisionVars() only registers the events, the vars are created when the search reaches them
+        # (plus the next varLookaheadTicks: max slew time (22) + slew start (2) + next cmd start (1))
+        # NOTE: with lazy vars the initial var count is only known after the search (see solveIt()), a search stopped
+        # before the horizon end also counts the events it never reached
+        self.lazyVars = True
+        self.varLookaheadTicks = 25
+        self.priorGpSet = set()
+        # propagateChoice() counts: expansions, vars touched, choices and vars removed, and the last expansion's counts
+        self.propagationCount = 0
+        self.propagationTouchedVars = 0
+        self.propagationRemovedChoices = 0
+        self.propagationRemovedVars = 0
+        self.lastPropagation = None
+        self.gpPostings = {} # gpi -> [(tick, satId, cmds)] (see createGpPostings())
+        # valSorter() cache: (var version, heuristic) -> sorted choices, least recently used first
+        self.valSorterCache = collections.OrderedDict()
+        self.valSorterCacheSize = 100000
+        self.valSorterCacheHits = 0
+        self.valSorterCacheMisses = 0
         self.initialVarCount = 0
         self.priorGPs = []
         self.priorHorizonFinalTick = None
@@ -161,6 +225,27 @@ class ObsPlanner:
             #   maxGpNormalizedChoiceScore = select val which maximizes GP * (gpChoiceScore/maxGpChoiceScore)
             #   maximizeGpRank = select val which maximizes each GP's choice rank (prefer each GP's 1st choice, then 2nd, etc).
 
+    def setSearchStrategy(self, strategy):
+        # strategy: "dfs", "beam.N" (N = # of nodes expanded on each loop),
+        #           "lds.D" (limited discrepancy search, D = max discrepancies from the greedy choice),
+        #           "restart.N" (N randomized greedy dives, the first one is pure greedy)
+        #           or "mcts.N" (monte carlo tree search, N rollouts per decision)
+        terms = strategy.split(".")
+        strategy = terms[0]
+        param = int(terms[1]) if len(terms) > 1 else None
+        if strategy not in ("dfs", "beam", "lds", "restart", "mcts") or (strategy != "dfs" and param is None):
+            print("ERROR! Invalid strategy: "+".".join(terms))
+            return False
+        self.nodeSorterHeuristic = strategy #"beam" #"dfs"
+        self.planner.nodeBeamWidth = param if strategy == "beam" else 1
+        self.planner.collectSuccessNodes = strategy == "lds"
+        self.planner.discrepancyLimit = param if strategy == "lds" else None
+        self.planner.restartCount = param if strategy == "restart" else 0
+        self.planner.mctsRolloutCount = param if strategy == "mcts" else 0
+        openNodeKeys = {"dfs": "dfs", "beam": "planReward", "lds": "lds", "restart": "dfs", "mcts": "dfs"}
+        self.planner.setOpenNodeKey(openNodeKeys[strategy])
+        return True
+
     def initSensorStatesAndGaps(self):
         for satId in self.satList:
             self.sensorStates[satId] = {"L": {}, "P": {}}
@@ -209,6 +294,11 @@ class ObsPlanner:
 
     def createDecisionVars(self):
         print("createDecisionVars()")
+        self.registerCmds()
+        if self.lazyVars:
+            self.createLazyDecisionVars()
+            self.createGpPostings()
+            return
         varCount = 0
         maxVarCount = None
         allEvents = []
@@ -227,16 +317,63 @@ class ObsPlanner:
             satEvents = self.satEvents[satId]
             choices = satEvents[tp]
             # choices = self.horizonEvents[tp]
-            self.planner.addVar(varName, choices)
+            self.planner.addVar(varName, choices, 0, satId, int(tp))
             varCount += 1
             if maxVarCount and varCount > maxVarCount:
                 break
 
         self.planner.rootNode.unassignedVars.sort(key=lambda x: x.tick)
+        self.createGpPostings()
         print("createDecisionVars() created "+str(varCount)+" vars/"+str(len(self.planner.rootNode.unassignedVars)))
         # for v in self.planner.rootNode.unassignedVars:
         #     print(str(v))
 
+    def registerCmds(self):
+        # gives every event cmd its dshieldUtil command registry id up front
+        for satEvents in self.satEvents.values():
+            for event in satEvents.values():
+                for cmd in event:
+                    dshieldUtil.getCmdId(cmd)
+        print("registerCmds() cmds: "+str(len(dshieldUtil.cmdNames)))
+
+    def createLazyDecisionVars(self):
+        # the root only gets the (satId, tick) of each event, createDecisionVar() creates the var when the search
+        # reaches it (see VarTable). Negative reward gps and prior observed gps are filtered then
+        # NOTE: the event files are still read (and kept) up front, only the vars and their filtering are lazy
+        allEvents = []
+        for satId in self.satEvents.keys():
+            print("createDecisionVars() s"+str(satId) +" events: "+str(len(self.satEvents[satId])))
+            for tp in self.satEvents[satId]:
+                allEvents.append((satId, tp))
+        allEvents.sort(key = lambda x: x[1])
+        self.priorGpSet = set(self.priorGPs)
+        self.planner.setLazyVars(allEvents, self.createDecisionVar, self.varLookaheadTicks)
+        print("createDecisionVars() "+str(len(allEvents))+" events, vars are created as the search reaches them")
+
+    def createDecisionVar(self, satId, tp):
+        # lazy var for event (satId, tp), None if no choice is left after filtering
+        satEvents = self.satEvents[satId]
+        event = satEvents[tp]
+        self.filterEventNegativeRewards(tp, event)
+        if self.priorGpSet and event:
+            # same gps as removeDuplicateObs() removes for the prior obs (gps with more than one access time)
+            for cmd in list(event.keys()):
+                gpList = [gpi for gpi in event[cmd] if not (gpi in self.priorGpSet and self.isRevisitedGp(gpi))]
+                if len(gpList) < len(event[cmd]):
+                    self.removedChoices += not gpList
+                    if gpList:
+                        event[cmd] = gpList
+                    else:
+                        event.pop(cmd)
+            self.removedVars += not event # emptied by the prior obs, like removeDuplicateObs() counts it
+        if not event:
+            satEvents.pop(tp)
+            return None
+        return Var("s" + str(satId)+"." + str(tp), event, 0, satId, int(tp))
+
+    def isRevisitedGp(self, gpi):
+        gp = self.getGP(gpi)
+        return gp is not None and len(gp.accessTimes) > 1
 
     def filterNegativeRewards(self, satEvents):
         removedTpCount = 0
@@ -248,25 +385,9 @@ class ObsPlanner:
         satTimes = list(satEvents.keys())
         for tick in satTimes:
             event = satEvents[tick]
-            # event: {'L.33': [195912, 195913, 195914, 195915], 'L.34': [195910, 195911], 'P.32': [195914, 195915]}
-            cmdChoices = list(event.keys())
-            for cmd in cmdChoices:
-                gpList = event[cmd]
-                filteredGpList = []
-                for gpId in gpList:
-                    if not self.useSortedGP or gpId in self.sortedHorizonGPerr:
-                        reward = self.getGpReward(gpId, tick, cmd)
-                        if reward > 0:
-                            filteredGpList.append(gpId)
-                        else:
-                            # print("filterNegativeRewards() removing gp: "+str(gpId))
-                            removedGpCount += 1
-                if filteredGpList:
-                    event[cmd] = filteredGpList
-                else:
-                    # print("filterNegativeRewards() removing cmd: "+str(cmd))
-                    event.pop(cmd)
-                    removedCmdCount += 1
+            eventRemovedGpCount, eventRemovedCmdCount = self.filterEventNegativeRewards(tick, event)
+            removedGpCount += eventRemovedGpCount
+            removedCmdCount += eventRemovedCmdCount
             if event:
                 satEvents[tick] = event
             else:
@@ -277,12 +398,38 @@ class ObsPlanner:
         print("filterNegativeRewards() removed gps: "+str(removedGpCount)+", removed cmds: "+str(removedCmdCount)+", removed tps: "+str(removedTpCount))
         return satEvents
 
+    def filterEventNegativeRewards(self, tick, event):
+        # removes gps with negative rewards from the event's cmds (and cmds left without gps)
+        # returns (removed gp count, removed cmd count)
+        removedGpCount = 0
+        removedCmdCount = 0
+        # event: {'L.33': [195912, 195913, 195914, 195915], 'L.34': [195910, 195911], 'P.32': [195914, 195915]}
+        cmdChoices = list(event.keys())
+        for cmd in cmdChoices:
+            gpList = event[cmd]
+            filteredGpList = []
+            for gpId in gpList:
+                if not self.useSortedGP or gpId in self.sortedHorizonGPerr:
+                    reward = self.getGpReward(gpId, tick, cmd)
+                    if reward > 0:
+                        filteredGpList.append(gpId)
+                    else:
+                        # print("filterNegativeRewards() removing gp: "+str(gpId))
+                        removedGpCount += 1
+            if filteredGpList:
+                event[cmd] = filteredGpList
+            else:
+                # print("filterNegativeRewards() removing cmd: "+str(cmd))
+                event.pop(cmd)
+                removedCmdCount += 1
+        return (removedGpCount, removedCmdCount)
+
     def solveIt(self):
         print("\nsolveIt()")
         self.successNode = None
-        self.initialVarCount = len(self.planner.rootNode.unassignedVars)
+        self.initialVarCount = self.planner.rootNode.unassignedVars.maxLen() # lazy vars: events
         print("initial var count: "+str(self.initialVarCount))
-        if self.priorGPs:
+        if self.priorGPs and not self.lazyVars: # lazy vars are created without the prior obs
             print("Removing prior obs ("+str(len(self.priorGPs))+")")
             self.removeDuplicateObs(self.planner.rootNode, self.priorGPs, None)
             print("   removedChoices: "+str(self.removedChoices)+", removedVars: "+str(self.removedVars))
@@ -290,11 +437,66 @@ class ObsPlanner:
             print("   var count after removing prior obs: " + str(newVarCount))
             self.initialVarCount = newVarCount
         # self.createInitialState()
-        self.successNode = self.planner.solveIt()
+        self.planner.timeLimit = self.timeLimitMinutes * 60 if self.timeLimitMinutes else None
+        self.planner.nodeLimit = self.nodeLimit
+        self.planner.memoryLimit = self.memoryLimitMB
+        if self.boundPruning:
+            self.createRewardBounds()
+            self.planner.setNodeHeuristic(self.getRewardBound)
+            self.planner.boundPruning = True
+        if self.useTranspositionTable:
+            self.planner.setNodeHasher(self.getSearchStateKey)
+        self.planner.keepFullTree = self.keepFullTree
+        self.planner.checkpointPath = self.checkpointPath
+        self.planner.checkpointInterval = self.checkpointMinutes * 60
+        if self.resumeCheckpoint and not self.planner.resumeFromCheckpoint(self.resumeCheckpoint):
+            print("solveIt() ERROR! can't resume from checkpoint: "+str(self.resumeCheckpoint))
+            return
+        if self.nodeMemoryLimit and not self.parallelSearch: # parallel workers open their own node store
+            self.planner.setNodeStore(self.nodeMemoryLimit, self.nodeSpillPath)
+        if self.planner.mctsRolloutCount and not self.parallelSearch: # parallel workers set up their own rollouts
+            self.initRollouts()
+        if self.logIncumbents and self.printIncumbentUpdate not in self.planner.incumbentListeners:
+            self.planner.addIncumbentListener(self.printIncumbentUpdate)
+        if self.parallelSearch == "rootChildren":
+            configs = [{"rootChild": nodeId} for nodeId in self.planner.rootNode.children if self.planner.getNode(nodeId) in self.planner.openNodes]
+            self.successNode = self.solveItPortfolio(configs)
+        elif self.parallelSearch == "portfolio":
+            self.successNode = self.solveItPortfolio(self.portfolioConfigs)
+        elif self.parallelSearch == "windows":
+            self.successNode = self.solveItWindows(self.windowCount or os.cpu_count() or 1)
+        else:
+            self.successNode = self.planner.solveIt()
+        if self.rolloutPool:
+            self.rolloutPool.close()
+            self.rolloutPool = None
         if self.successNode:
             print("Solution Found!")
+            if self.planner.stopReason:
+                print("Search stopped at "+self.planner.stopReason+", using incumbent plan. Gap estimate: "+str(self.planner.gapEstimate))
+                self.stats["stopReason"] = self.planner.stopReason
+                self.stats["gapEstimate"] = self.planner.gapEstimate
+            print("valSorter cache: "+str(self.valSorterCacheHits)+" hits, "+str(self.valSorterCacheMisses)+" misses")
+            if self.lazyVars:
+                # the events left without choices are known now (all of them if the search reached the horizon end):
+                # same initial var count as eager vars after the prior obs are removed
+                varTable = self.planner.rootNode.unassignedVars.table
+                self.initialVarCount = sum(1 for var in varTable.vars if var is not None)
+                print("Lazy vars: "+str(varTable.materializedCount)+" of "+str(len(varTable.vars))+" events created, initial var count: "+str(self.initialVarCount))
+                self.stats["lazyVarsCreated"] = varTable.materializedCount
+            self.stats["valSorterCacheHits"] = self.valSorterCacheHits
+            if self.propagationCount:
+                print("propagateChoice() expansions: "+str(self.propagationCount)+", per expansion: "+format(self.propagationTouchedVars / self.propagationCount, '.2f')+" vars touched, "+format(self.propagationRemovedChoices / self.propagationCount, '.2f')+" choices and "+format(self.propagationRemovedVars / self.propagationCount, '.2f')+" vars removed")
+                self.stats["propagationRemovedChoices"] = self.propagationRemovedChoices
+                self.stats["propagationRemovedVars"] = self.propagationRemovedVars
+            if self.useTranspositionTable:
+                print("Transposition table: "+str(len(self.planner.transpositionTable))+" states, "+str(self.planner.transpositionHits)+" duplicates closed")
+                self.stats["transpositionHits"] = self.planner.transpositionHits
             self.plan = self.collectPlan(self.successNode) # Used by executePlan()
             self.observedGPs = self.collectObservedGP(self.successNode) #self.successNode.state['observedGp']
+            if self.nodeMemoryLimit and not self.parallelSearch:
+                nodeStore = self.planner.allNodes
+                print("Node store: "+str(nodeStore.spillWrites)+" nodes spilled, "+str(nodeStore.spillReads)+" loaded back, "+str(nodeStore.spilledCount)+" on disk")
             # obsGP = self.collectObservedGP(self.successNode)
             if self.isGapPlan:
                 # combine initial plan and gap plan
@@ -338,7 +540,7 @@ class ObsPlanner:
 #     Node State
 
     def createInitialState(self):
-        state = {}
+        state = NodeState()
         self.planner.setInitialState(state)
         # if not self.isGapPlan: # not gap planning
         #     # satPlans  = {}
@@ -355,8 +557,7 @@ class ObsPlanner:
     def updateState(self, node, var, choiceInfo):
         # choice is pair: (option, gpList)
         # print("updateState() choice: "+str(choiceInfo))
-        node.state['sat'] = var.satId
-        node.state['tick'] = var.tick
+        node.state = node.state.replace(sat=var.satId, tick=var.tick)
         choice = choiceInfo[0]
         gpList = choiceInfo[1] #[:-1] # strip off the choice score (last item in gpList)
         # choiceScore = 0
@@ -382,6 +583,8 @@ class ObsPlanner:
         # if isinstance(choice, int):
         #     choice = var.payload + "."+str(choice)
         self.updateNodeRewards(node, var, choice, gpList, "maxErrReduction")
+        if self.useTranspositionTable:
+            self.updateStateHash(node, var, choice, gpList)
         # self.updateSearchDepth(node)
         # self.updateSatPlanAndEnergy(node, choiceInfo[0])
 
@@ -390,6 +593,187 @@ class ObsPlanner:
         return (True, statusMsg)
 
 
+    def updateStateHash(self, node, var, choice, gpList):
+        # incremental zobrist hash of the observed gps, plus the last obs (tick, pointing angle) of each sat
+        gpHash = node.state.get("gpHash", 0)
+        for gpi in gpList:
+            gpHash ^= self.getGpZobristKey(gpi)
+        lastObs = dict(node.state.get("lastObs", {}))
+        lastObs[var.satId] = (var.tick, self.getPointingAngleFromChoice(choice))
+        node.state = node.state.replace(gpHash=gpHash, lastObs=lastObs)
+
+    def getGpZobristKey(self, gpi):
+        if gpi not in self.gpZobristKeys:
+            self.gpZobristKeys[gpi] = self.zobristRandom.getrandbits(64)
+        return self.gpZobristKeys[gpi]
+
+    def getSearchStateKey(self, node):
+        # nodes with the same key have the same remaining choices: observed gps are removed from all future choices
+        # (removeDuplicateObs()), a last obs only constrains vars up to maxSlewTime after it (removeInfeasibleSlewChoices())
+        # and only the frontier var loses choices when a node is expanded
+        maxSlewTime = 22
+        frontier = None
+        nextTick = float("inf")
+        if node.unassignedVars:
+            nextVar = node.unassignedVars[0]
+            frontier = (nextVar.name, tuple(nextVar.choiceKeys()))
+            nextTick = nextVar.tick
+        lastObs = node.state.get("lastObs", {})
+        slewObs = tuple(sorted((satId, obs) for satId, obs in lastObs.items() if nextTick - (obs[0] + 2) <= maxSlewTime))
+        return (node.state.get("gpHash", 0), frontier, slewObs)
+
+    #===========================
+    # monte carlo tree search rollouts
+    # A rollout is a light randomized greedy plan over the root vars after the node's frontier: it only tracks
+    # the observed gps and the last obs of each sat (duplicate and slew checks), not a search node per step.
+
+    def initRollouts(self):
+        global rolloutPlanner
+        rolloutPlanner = self
+        self.rolloutVars = list(self.planner.rootNode.unassignedVars)
+        self.rolloutTicks = [var.tick for var in self.rolloutVars]
+        self.rolloutContexts = {}
+        self.planner.rolloutEvaluator = self.evaluateRollouts
+        workers = self.rolloutWorkers or 1
+        self.planner.mctsBatchSize = workers
+        if workers > 1:
+            self.rolloutPool = multiprocessing.get_context("fork").Pool(workers)
+        print("initRollouts() vars: "+str(len(self.rolloutVars))+", workers: "+str(workers)+", depth: "+str(self.rolloutDepth))
+
+    def evaluateRollouts(self, nodes):
+        # estimated reward still available below each node: one rollout per node
+        tasks = []
+        for node in nodes:
+            observedGps, lastObs = self.getRolloutContext(node)
+            nextTick = node.unassignedVars[0].tick if node.unassignedVars else None
+            self.rolloutCount += 1
+            tasks.append((nextTick, lastObs, observedGps, self.rolloutCount))
+        if self.rolloutPool:
+            return self.rolloutPool.map(runRolloutTask, tasks)
+        return [self.runRollout(*task) for task in tasks]
+
+    def getRolloutContext(self, node):
+        # returns (observed gps, last obs per sat) for the plan ending at node
+        if len(self.rolloutContexts) > 10000:
+            self.rolloutContexts.clear()
+        path = []
+        while node and node.id not in self.rolloutContexts and node.var:
+            path.append(node)
+            node = self.planner.getParentNode(node)
+        observedGps, lastObs = self.rolloutContexts.get(node.id, (frozenset(), {})) if node else (frozenset(), {})
+        for pathNode in reversed(path):
+            cmd, gpList = pathNode.var.assignment[0], pathNode.var.assignment[1]
+            observedGps = observedGps.union(gpList)
+            lastObs = dict(lastObs)
+            lastObs[pathNode.var.satId] = (pathNode.var.tick, cmd)
+            self.rolloutContexts[pathNode.id] = (observedGps, lastObs)
+        return observedGps, lastObs
+
+    def runRollout(self, nextTick, lastObs, observedGps, seed):
+        # returns the reward of a randomized greedy plan for the vars from nextTick (up to rolloutDepth vars)
+        if nextTick is None:
+            return 0
+        rng = random.Random(seed)
+        observed = set(observedGps)
+        lastObs = dict(lastObs)
+        reward = 0
+        start = bisect.bisect_left(self.rolloutTicks, nextTick)
+        end = start + self.rolloutDepth if self.rolloutDepth else len(self.rolloutVars)
+        for var in self.rolloutVars[start:end]:
+            last = lastObs.get(var.satId)
+            if last and var.tick <= last[0]:
+                continue # var assigned (or passed) by the node's plan
+            candidates = []
+            for cmd, gpRewards in self.getRolloutChoiceRewards(var):
+                if last and not self.isSlewFeasible(last[0], last[1], var.tick, cmd):
+                    continue
+                choiceReward = 0
+                for gpi, gpReward in gpRewards:
+                    if gpi not in observed:
+                        choiceReward += gpReward
+                if choiceReward > 0:
+                    candidates.append((choiceReward, cmd, gpRewards))
+            if not candidates:
+                continue
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            pick = candidates[0]
+            if len(candidates) > 1 and rng.random() < self.rolloutRandomRate:
+                pick = candidates[rng.randrange(1, min(3, len(candidates)))]
+            reward += pick[0]
+            observed.update(gpi for gpi, gpReward in pick[2])
+            lastObs[var.satId] = (var.tick, pick[1])
+        return reward
+
+    def getRolloutChoiceRewards(self, var):
+        if var.name not in self.rolloutChoiceRewards:
+            self.rolloutChoiceRewards[var.name] = [(cmd, [(gpi, self.getGpReward(gpi, var.tick, cmd)) for gpi in gpList]) for cmd, gpList in var.choices.items()]
+        return self.rolloutChoiceRewards[var.name]
+
+    def printIncumbentUpdate(self, update):
+        steps = ", ".join("s"+str(var.satId)+"."+str(var.tick)+" "+str(var.assignment[0]) for nodeId, var, choiceReward, planReward in update["newSteps"])
+        print("incumbent: node "+str(update["nodeId"])+", planReward: "+str(round(update["planReward"], 5))+", elapsed: "+format(update["elapsed"], '.3f')+" s, after node "+str(update["baseNodeId"])+": "+steps)
+
+    def createRewardBounds(self):
+        # per sat suffix sums of each var's best choice reward, indexed by tick (see getRewardBound())
+        # negative gp rewards are filtered out when the vars are created, so a choice can't earn more
+        # once gps are removed from it (duplicates, prior obs): the sums are upper bounds
+        satRewards = {}
+        for var in self.planner.rootNode.unassignedVars:
+            bestReward = max([self.getRewardForErrReductionHeuristic(var.tick, cmd, gpList) for cmd, gpList in var.choices.items()], default=0)
+            satRewards.setdefault(var.satId, []).append((var.tick, bestReward))
+        self.rewardBoundTicks = {}
+        self.rewardBoundSums = {}
+        for satId, tickRewards in satRewards.items():
+            sums = [0] * (len(tickRewards) + 1)
+            for i in range(len(tickRewards) - 1, -1, -1):
+                sums[i] = sums[i+1] + tickRewards[i][1]
+            self.rewardBoundTicks[satId] = [tick for tick, reward in tickRewards]
+            self.rewardBoundSums[satId] = sums
+            print("createRewardBounds() s"+str(satId)+" vars: "+str(len(tickRewards))+", bound: "+str(sums[0]))
+        # each gp is observed at one tick only (removeDuplicateObs() removes it from the vars at other ticks), but by
+        # every sat that observes it at that tick: sweep ticks backwards keeping every gp's best tick reward from that
+        # tick on, a tick reward is the sum of the best reward of the gp in each sat's var at the tick
+        gpBestReward = {}
+        gpBound = 0
+        tickBounds = []
+        vars = list(self.planner.rootNode.unassignedVars)
+        i = len(vars)
+        while i > 0:
+            tick = vars[i-1].tick
+            tickGpRewards = {}
+            while i > 0 and vars[i-1].tick == tick:
+                i -= 1
+                varGpRewards = {}
+                for cmd, gpList in vars[i].choices.items():
+                    for gpi in gpList:
+                        varGpRewards[gpi] = max(varGpRewards.get(gpi, 0), self.getGpReward(gpi, tick, cmd))
+                for gpi, reward in varGpRewards.items():
+                    tickGpRewards[gpi] = tickGpRewards.get(gpi, 0) + reward
+            for gpi, reward in tickGpRewards.items():
+                if reward > gpBestReward.get(gpi, 0):
+                    gpBound += reward - gpBestReward.get(gpi, 0)
+                    gpBestReward[gpi] = reward
+            tickBounds.append((tick, gpBound))
+        tickBounds.reverse()
+        self.gpBoundTicks = [tick for tick, bound in tickBounds]
+        self.gpBoundSums = [bound for tick, bound in tickBounds] + [0]
+        print("createRewardBounds() gp bound: "+str(gpBound))
+
+    def getRewardBound(self, node):
+        # upper bound on the reward still available below node: best choice rewards of all vars between node's
+        # first and last unassigned ticks (vars are assigned in tick order), capped by the best reward of every gp
+        # still accessible after the first unassigned tick
+        if not node.unassignedVars:
+            return 0
+        firstTick = node.unassignedVars[0].tick
+        lastTick = node.unassignedVars[-1].tick
+        bound = 0
+        for satId, ticks in self.rewardBoundTicks.items():
+            sums = self.rewardBoundSums[satId]
+            bound += sums[bisect.bisect_left(ticks, firstTick)] - sums[bisect.bisect_right(ticks, lastTick)]
+        gpBound = self.gpBoundSums[bisect.bisect_left(self.gpBoundTicks, firstTick)]
+        return min(bound, gpBound)
+
     def updateNodeRewards(self, node, var, cmd, gpList, heuristic):
         choiceReward = self.getCmdReward(var.tick, cmd, gpList, heuristic)
         node.choiceReward = choiceReward
@@ -398,6 +782,184 @@ class ObsPlanner:
             parentPlanReward = parentNode.planReward
             node.planReward = parentPlanReward + choiceReward
 
+    #===========================
+    # parallel search
+    # Each config runs in its own forked process. Workers inherit the preprocessed vars and root node
+    # copy-on-write, share the best planReward found so far, and send back their best plan (exportPlan())
+    # which is rebuilt here with importPlan(). Config keys: strategy, valSelectorHeuristic, rootChild (node id),
+    # window (startTick, endTick)
+
+    def solveItPortfolio(self, configs):
+        print("solveItPortfolio() configs: "+str(configs))
+        if not configs:
+            return self.planner.solveIt()
+        results = self.runWorkers(configs)
+        if not results:
+            print("solveItPortfolio() INFEASIBLE!")
+            return None
+        # best planReward wins, ties go to the lowest worker id (deterministic)
+        workerId, best = max(results, key=lambda r: (r[1]["planReward"], -r[0]))
+        print("solveItPortfolio() winner: worker "+str(workerId)+" "+str(configs[workerId]))
+        self.stats["portfolioWinner"] = str(configs[workerId])
+        self.planner.stopReason = best["stopReason"]
+        self.planner.gapEstimate = None
+        return self.planner.importPlan(best["plan"])
+
+    def runWorkers(self, configs):
+        # runs one forked runPortfolioWorker() per config, returns [(workerId, result)] for workers that found a plan
+        ctx = multiprocessing.get_context("fork")
+        sharedBestReward = ctx.Value("d", float("-inf"))
+        resultQueue = ctx.Queue()
+        workerCount = min(len(configs), self.portfolioWorkers or os.cpu_count() or 1)
+        pending = list(enumerate(configs))
+        running = {}
+        results = []
+        while pending or running:
+            while pending and len(running) < workerCount:
+                workerId, config = pending.pop(0)
+                worker = ctx.Process(target=self.runPortfolioWorker, args=(workerId, config, sharedBestReward, resultQueue))
+                worker.start()
+                running[workerId] = worker
+            try:
+                workerId, result = resultQueue.get(timeout=1)
+            except queue.Empty:
+                # a worker that died without reporting (e.g. killed) would otherwise block forever
+                for workerId, worker in list(running.items()):
+                    if not worker.is_alive() and resultQueue.empty():
+                        print("runWorkers() worker died: "+str(workerId)+", exitcode: "+str(worker.exitcode))
+                        del running[workerId]
+                continue
+            running.pop(workerId).join()
+            if result:
+                print("runWorkers() worker "+str(workerId)+" "+str(configs[workerId])+" planReward: "+str(result["planReward"])+", nodes: "+str(result["nodeCount"])+", stopReason: "+str(result["stopReason"]))
+                results.append((workerId, result))
+            else:
+                print("runWorkers() worker "+str(workerId)+" "+str(configs[workerId])+" found no plan")
+        return results
+
+    def runPortfolioWorker(self, workerId, config, sharedBestReward, resultQueue):
+        result = None
+        try:
+            if "rootChild" in config:
+                # search only the subtree of this root child
+                for node in list(self.planner.openNodes):
+                    if node.id != config["rootChild"]:
+                        self.planner.updateNodeStatus(node, "closed", "searched by another worker")
+            if "window" in config:
+                # search only the vars in [windowStart, windowEnd), the other windows are stitched in by solveItWindows()
+                windowStart, windowEnd = config["window"]
+                for node in self.planner.openNodes:
+                    node.unassignedVars.keepTickRange(windowStart, windowEnd)
+                sharedBestReward = None # window rewards don't compete
+            if "strategy" in config and not self.setSearchStrategy(config["strategy"]):
+                return
+            if "valSelectorHeuristic" in config:
+                self.valSelectorHeuristic = config["valSelectorHeuristic"]
+            self.planner.sharedIncumbentReward = sharedBestReward
+            if self.nodeMemoryLimit:
+                # opened after the fork: a SQLite connection can't be shared with the parent process
+                spillPath = self.nodeSpillPath + "." + str(workerId) if self.nodeSpillPath else None
+                self.planner.setNodeStore(self.nodeMemoryLimit, spillPath)
+            if self.planner.mctsRolloutCount:
+                # rollouts run in the worker: the workers already use the cores (and a pool can't be inherited by a fork)
+                self.rolloutWorkers = None
+                self.initRollouts()
+            node = self.planner.solveIt()
+            if node:
+                result = {"planReward": node.planReward,
+                          "plan": self.planner.exportPlan(node),
+                          "nodeCount": self.planner.nextNodeId,
+                          "stopReason": self.planner.stopReason}
+        finally:
+            resultQueue.put((workerId, result))
+
+    def solveItWindows(self, windowCount):
+        # solves each time window in its own worker, then stitches the window plans into one plan
+        cuts = self.getWindowCuts(windowCount)
+        bounds = [0] + cuts + [float("inf")]
+        configs = [{"window": (bounds[i], bounds[i+1])} for i in range(len(bounds) - 1)]
+        print("solveItWindows() windows: "+str(configs))
+        self.stats["windowCuts"] = cuts
+        results = self.runWorkers(configs)
+        if not results:
+            print("solveItWindows() INFEASIBLE!")
+            return None
+        results.sort(key=lambda r: r[0]) # window order
+        windowPlans = [result["plan"] for workerId, result in results]
+        stopReasons = [result["stopReason"] for workerId, result in results if result["stopReason"]]
+        self.planner.stopReason = stopReasons[0] if stopReasons else None
+        self.planner.gapEstimate = None
+        return self.planner.importPlan(self.stitchWindowPlans(windowPlans))
+
+    def getWindowCuts(self, windowCount):
+        # returns the first tick of each window after the first
+        # each cut is placed at the largest access gap (no access for any sat) around an equal var count split,
+        # these are the gaps marked "# ~~ N sec gap" by the preprocessor. Large gaps leave room to slew across the cut
+        ticks = sorted(set(var.tick for var in self.planner.rootNode.unassignedVars))
+        tickCount = len(ticks)
+        cuts = []
+        for k in range(1, windowCount):
+            zoneStart = max(1, tickCount * (2*k - 1) // (2*windowCount))
+            zoneEnd = min(tickCount, tickCount * (2*k + 1) // (2*windowCount))
+            bestGap = None
+            for i in range(zoneStart, zoneEnd):
+                gap = ticks[i] - ticks[i-1] - 1
+                if gap > 0 and (not bestGap or gap > bestGap[0]):
+                    bestGap = (gap, ticks[i])
+            if bestGap and (not cuts or bestGap[1] > cuts[-1]):
+                cuts.append(bestGap[1])
+        print("getWindowCuts() windowCount: "+str(windowCount)+", cuts: "+str(cuts))
+        return cuts
+
+    def stitchWindowPlans(self, windowPlans):
+        # windowPlans: exportPlan() steps for each window, in window order
+        # 1. slew: a step that can't be reached from the previous kept step of its sat is dropped (earlier steps win)
+        # 2. duplicates: each gp is kept only in the step where it has the highest reward
+        # 3. steps left without gp are dropped, rewards are recomputed
+        steps = [step for plan in windowPlans for step in plan]
+        steps.sort(key=lambda step: step[0].tick)
+        lastSatStep = {}
+        keptSteps = []
+        slewDrops = 0
+        for step in steps:
+            var = step[0]
+            lastVar = lastSatStep.get(var.satId)
+            if lastVar and not self.isSlewFeasible(lastVar.tick, lastVar.assignment[0], var.tick, var.assignment[0]):
+                slewDrops += 1
+                continue
+            lastSatStep[var.satId] = var
+            keptSteps.append(var)
+        bestGpStep = {} # gpi -> (reward, var)
+        for var in keptSteps:
+            cmd, gpList = var.assignment[0], var.assignment[1]
+            for gpi in gpList:
+                reward = self.getGpReward(gpi, var.tick, cmd)
+                if gpi not in bestGpStep or reward > bestGpStep[gpi][0]:
+                    bestGpStep[gpi] = (reward, var)
+        result = []
+        planReward = 0
+        duplicateGps = 0
+        for var in keptSteps:
+            cmd, gpList = var.assignment[0], var.assignment[1]
+            keptGps = [gpi for gpi in gpList if bestGpStep[gpi][1] is var]
+            duplicateGps += len(gpList) - len(keptGps)
+            if not keptGps:
+                continue
+            var.assignment = (cmd, keptGps) + tuple(var.assignment[2:])
+            choiceReward = self.getCmdReward(var.tick, cmd, keptGps, "maxErrReduction")
+            planReward += choiceReward
+            result.append((var, choiceReward, planReward))
+        print("stitchWindowPlans() steps: "+str(len(steps))+", slew drops: "+str(slewDrops)+", duplicate gps: "+str(duplicateGps)+", final steps: "+str(len(result)))
+        self.stats["stitchSlewDrops"] = slewDrops
+        self.stats["stitchDuplicateGps"] = duplicateGps
+        return result
+
+    def isSlewFeasible(self, fromTick, fromChoice, toTick, toChoice):
+        # same rule as removeInfeasibleSlewChoices(): slew starts 2 ticks after fromTick, plus 1 tick for the next cmd start
+        fromAngle = self.getPointingAngleFromChoice(fromChoice)
+        toAngle = self.getPointingAngleFromChoice(toChoice)
+        return self.slewModel.isFeasible(fromAngle, toAngle, toTick - fromTick)
+
     def collectObservedGP(self, node):
         observedGp = []
         done = False
@@ -595,10 +1157,7 @@ class ObsPlanner:
     #         print("getNodeEnergy() ERROR! plan step missing!")
 
     def getSlewTimeAndEnergy(self, fromAngle, toAngle):
-        slewTableRow = self.slewTable[fromAngle]
-        slewTime, slewEnergy = slewTableRow[toAngle]
-        slewTimeCeil = math.ceil(slewTime)
-        return (slewTimeCeil, slewEnergy)
+        return self.slewModel.getSlewTimeAndEnergy(fromAngle, toAngle)
 
     def getPlanStep(self, nodeId, planSteps):
         for step in planSteps:
@@ -609,129 +1168,101 @@ class ObsPlanner:
 #     Constraints
 
     def propagateChoice(self, node, var):
-        self.removeDuplicateObs(node, var.assignment[1], var.tick)
-        self.removeInfeasibleSlewChoices(node, var)
+        # forward checking for one assignment: the duplicate gp removals and the slew window of var's sat are collected
+        # into one delta, then applied with at most one new version per affected var (applyPropagationDelta())
+        delta = {}
+        self.addDuplicateObsDelta(node, var.assignment[1], var.tick, delta)
+        self.addInfeasibleSlewDelta(node, var, delta)
+        touchedVars, removedChoices, removedVars = self.applyPropagationDelta(node, delta)
+        self.propagationCount += 1
+        self.propagationTouchedVars += touchedVars
+        self.propagationRemovedChoices += removedChoices
+        self.propagationRemovedVars += removedVars
+        self.lastPropagation = (touchedVars, removedChoices, removedVars)
 
     def removeDuplicateObs(self, node, gpList, varTick):
         # remove all GP in GPlist from node var's future choices
         # varTick is currentTick when called for current horizon, None for previous horizon
-        changedVars = []
-        replacementVars = []
-        for gpi in gpList:
-            gp = self.getGP(gpi)
-            if gp:
-                gpTimes = gp.accessTimes
-                if len(gpTimes) > 1:
-                    for gpTime in gpTimes:
-                        if not gpTime == varTick:
-                            # multiple sats may have action at same time (though likely not same GP at same time)
-                            otherVars = self.getVarsForTime(node, gpTime)
-                            for otherVar in otherVars:
-                                varIndex = node.unassignedVars.index(otherVar)
-                                # handle case when the same var has multiple GP removed (need to propagate/accumulate the changes for each GP)
-                                otherVarCopy = self.findReplacementVar(varIndex, replacementVars)
-                                if otherVarCopy:
-                                    otherVar = otherVarCopy
-                                choicesToRemove = []
-                                updatedGpLists = {}
-                                for otherVarChoiceKey in otherVar.choices.keys():
-                                    choiceGPlist = otherVar.choices[otherVarChoiceKey]
-                                    if gpi in choiceGPlist:
-                                        # print("found other choice for gp "+str(gpi)+": "+str(otherVar.name)+", "+str(otherVarChoiceKey)+": "+str(choiceGPlist))
-                                        choiceGPlist = choiceGPlist.copy() # copy gpList so removing gpi doesn't change parent node
-                                        choiceGPlist.remove(gpi)
-                                        updatedGpLists[otherVarChoiceKey] = choiceGPlist
-                                        if not choiceGPlist:
-                                            print("removeDuplicateObs() GP "+str(gpi) + ", removing empty choice: "+str(otherVarChoiceKey)+" from var: "+str(otherVar))
-                                            choicesToRemove.append(otherVarChoiceKey)
-                                if choicesToRemove or updatedGpLists:
-                                    otherVarCopy = self.findReplacementVar(varIndex, replacementVars)
-                                    if not otherVarCopy:
-                                        otherVarCopy = copy.deepcopy(otherVar)
-                                        replacementVars.append((varIndex, otherVarCopy))
-                                    for updatedGpListKey in updatedGpLists.keys():
-                                        if updatedGpListKey in otherVar.choices:
-                                            otherVarCopy.choices[updatedGpListKey] = updatedGpLists[updatedGpListKey]
-                                    if otherVarCopy not in changedVars:
-                                        changedVars.append(otherVarCopy)
-                                    for choice in choicesToRemove:
-                                        otherVarCopy.choices.pop(choice) # pop dictionary by key
-                                        self.removedChoices += 1
-
-        for varIndex, otherVarCopy in replacementVars:
-            node.unassignedVars[varIndex] = otherVarCopy
-
-        varsToRemove = []
-        if changedVars:
-            for v in changedVars:
-                if not self.varHasChoices(v):
-                    varsToRemove.append(v)
-        if varsToRemove:
-            for v in varsToRemove:
-                print("removeDuplicateObs() removing empty var: "+str(v))
-                if v in node.unassignedVars:
-                    node.unassignedVars.remove(v)
-                self.removedVars += 1
+        delta = {}
+        self.addDuplicateObsDelta(node, gpList, varTick, delta)
+        self.applyPropagationDelta(node, delta)
 
     def removeInfeasibleSlewChoices(self, node, var):
-        maxSlewTime = 22
-        changedVars = []
+        delta = {}
+        self.addInfeasibleSlewDelta(node, var, delta)
+        self.applyPropagationDelta(node, delta)
+
+    def createGpPostings(self):
+        # gpi -> [(tick, satId, keys of the event's cmds that observe gpi)] in tick order, for removeDuplicateObs()
+        # only gps with more than one access time are propagated
+        # NOTE: with lazy vars the events are filtered after this, Var.without() ignores the cmds that lost the gp
+        self.gpPostings = {}
+        for satId, satEvents in self.satEvents.items():
+            for tick, event in satEvents.items():
+                gpKeys = {}
+                for cmd, gpList in event.items():
+                    for gpi in gpList:
+                        gpKeys.setdefault(gpi, []).append(cmd)
+                for gpi, keys in gpKeys.items():
+                    if self.isRevisitedGp(gpi):
+                        self.gpPostings.setdefault(gpi, []).append((tick, satId, tuple(keys)))
+        for postings in self.gpPostings.values():
+            postings.sort(key=lambda posting: posting[0])
+        print("createGpPostings() gps: "+str(len(self.gpPostings))+", postings: "+str(sum(len(postings) for postings in self.gpPostings.values())))
+
+    def addDuplicateObsDelta(self, node, gpList, varTick, delta):
+        # adds (gpi, choice keys) to delta[var index] for the later vars that observe a gp of gpList
+        # gpPostings gives the (tick, sat, choice keys) of the gp's events, so only the vars that observe it are visited
+        # gps that were already removed from a var are ignored by Var.without() (no new version)
+        frontier = node.unassignedVars
+        for gpi in gpList:
+            for gpTime, satId, choiceKeys in self.gpPostings.get(gpi, ()):
+                if not gpTime == varTick:
+                    otherVar = frontier.getVarAt(satId, gpTime)
+                    if otherVar is not None:
+                        delta.setdefault(otherVar.index, ([], []))[0].append((gpi, choiceKeys))
+
+    def addInfeasibleSlewDelta(self, node, var, delta):
+        # adds the choice keys of var's sat vars that can't be reached by a slew from var's choice to delta[var index]
+        # var.tick + 1 is obsFinish, so varTick + 2 is first slew tick, plus 1 tick for the next cmd start
+        # (see SlewModel.feasibleRows)
         satId = var.satId
-        earliestSlewTick = var.tick + 2 # var.tick + 1 is obsFinish, so varTick + 2 is first slew tick
         fromAngle = self.getPointingAngleFromChoice(var.assignment[0])
-        replacementVars = []
-        for otherVar in node.unassignedVars:
-            otherVarSat = otherVar.satId
-            otherVarTick = otherVar.tick
-            # otherVarPayload = otherVar.payload
-            if otherVarTick - earliestSlewTick > maxSlewTime:
-                break
-            elif satId != otherVarSat:
-                continue # ignore other var if it's from another sat or if it's tick is > maxSlewTime later than endTick
-            choices = otherVar.choices
+        isFeasible = self.slewModel.isFeasible
+        # other sats' vars aren't affected, ignore vars whose tick is > maxSlewTime later than the first slew tick
+        for otherVar in node.unassignedVars.varsInTickRange(0, var.tick + self.slewModel.maxDeltaTick + 1, satId):
+            deltaTick = otherVar.tick - var.tick
             choicesToRemove = []
-            for choiceKey in choices.keys():
-                # fullCmd = choiceKey
-                # if isinstance(choiceKey, int):
-                #     fullCmd = otherVarPayload + "."+str(choiceKey)
-                toAngle = self.getPointingAngleFromChoice(choiceKey)
-                if fromAngle != toAngle:
-                    slewTime, slewEnergy = self.getSlewTimeAndEnergy(fromAngle, toAngle)
-                    earliestStartWithSlew = earliestSlewTick + slewTime + 1 # add 1 to leave room for next cmd start
-                    if otherVarTick < earliestStartWithSlew :
-                        # print("  Infeasible choice: " + str(choiceKey) + ", slew time from: " + str(fromAngle) + " @ " + str(earliestSlewTick) + " to " + str(toAngle) + " @ " + str(otherVar.tick) + " = " + str(slewTime) + ", earliestStartWithSlew: "+str(earliestStartWithSlew))
-                        choicesToRemove.append(choiceKey)
+            for choiceKey in otherVar.choiceKeys():
+                if not isFeasible(fromAngle, self.getPointingAngleFromChoice(choiceKey), deltaTick):
+                    # print("  Infeasible choice: " + str(choiceKey) + " @ " + str(otherVar.tick) + " after " + str(fromAngle) + " @ " + str(var.tick))
+                    choicesToRemove.append(choiceKey)
             if choicesToRemove:
-                otherVarCopy = copy.deepcopy(otherVar)
-                varIndex = node.unassignedVars.index(otherVar)
-                replacementVars.append((varIndex, otherVarCopy))
-                if otherVarCopy not in changedVars:
-                    changedVars.append(otherVarCopy)
-                for infeasibleChoice in choicesToRemove:
-                    # print("removeInfeasibleSlewChoices() removing choice: "+str(infeasibleChoice))
-                    otherVarCopy.choices.pop(infeasibleChoice) # pop dictionary by key
-                    self.removedChoices += 1
-
-        for varIndex, otherVarCopy in replacementVars:
-            node.unassignedVars[varIndex] = otherVarCopy
-
-        varsToRemove = []
-        if changedVars:
-            for v in changedVars:
-                if not self.varHasChoices(v):
-                    varsToRemove.append(v)
-        if varsToRemove:
-            for v in varsToRemove:
-                # print("removeInfeasibleSlewChoices() removing empty var: "+str(v))
-                node.unassignedVars.remove(v)
-                self.removedVars += 1
-
-    def findReplacementVar(self, varIndex, replacementVars):
-        for pair in replacementVars:
-            if pair[0] == varIndex:
-                otherVarCopy = pair[1]
-                return otherVarCopy
-        return None
+                delta.setdefault(otherVar.index, ([], []))[1].extend(choicesToRemove)
+
+    def applyPropagationDelta(self, node, delta):
+        # delta: var index -> ([(gpi, choice keys)] to remove, choice keys to remove)
+        # vars are shared with other nodes, changed vars are replaced by new versions (see Var.without())
+        # returns (touched vars, removed choices, removed vars)
+        frontier = node.unassignedVars
+        removedChoices = 0
+        removedVars = 0
+        for index in sorted(delta):
+            gps, choiceKeys = delta[index]
+            var = frontier.getVar(index)
+            updatedVar, emptyChoices, removedKeys = var.without(choiceKeys, gps)
+            for gpi, emptyChoice in emptyChoices:
+                print("removeDuplicateObs() GP "+str(gpi) + ", removing empty choice: "+str(emptyChoice)+" from var: "+str(var))
+            removedChoices += len(emptyChoices) + len(removedKeys)
+            if updatedVar is not var:
+                frontier.replace(updatedVar)
+                if not self.varHasChoices(updatedVar):
+                    # print("applyPropagationDelta() removing empty var: "+str(updatedVar))
+                    frontier.remove(updatedVar)
+                    removedVars += 1
+        self.removedChoices += removedChoices
+        self.removedVars += removedVars
+        return (len(delta), removedChoices, removedVars)
 
     # def removeImageLockedChoices(self, node, var):
     #     changedVars = []
@@ -891,9 +1422,9 @@ class ObsPlanner:
         #convert from angle to err code
         candidateChoices = {}
         for unelected in unelectedCandidates:
-            choiceInfo = dshieldUtil.parseChoice(unelected)
-            payload = choiceInfo['payload'] # TODO: handle multiple obs
-            errorCode = choiceInfo['errorCode']
+            cmdId = dshieldUtil.getCmdId(unelected)
+            payload = dshieldUtil.cmdPayloads[cmdId] # TODO: handle multiple obs
+            errorCode = dshieldUtil.cmdErrorCodes[cmdId]
             key = payload +"."+str(errorCode)
             if key not in candidateChoices:
                 candidateChoices[key] = []
@@ -1144,21 +1675,12 @@ class ObsPlanner:
 #   Planner callbacks
 
     def nodeSorter(self):
-        searchStrategy = self.nodeSorterHeuristic
+        # open nodes are kept in a heap ordered by the strategy's key (set in constructor):
+        #   beam: highest planReward first
+        #   dfs:  newest node first
         winners = []
         if self.planner.openNodes:
-            if searchStrategy == "beam":
-                winners = self.sortNodesByPlanReward()
-            elif searchStrategy == "dfs":
-                # return open nodes in reverse order
-                winners.extend(self.planner.openNodes)
-                winners.reverse()
-                # bestIndex = -2 if len(self.planner.openNodes) > 1 else -1
-                # winners.append(self.planner.openNodes[bestIndex]) # winner is a node (not node id)
-                #don't select first child from root if it doesn't collect any data
-                # if self.planner.isRootChild(winner) and winner.choice == 0:
-                #     print("nodeSorter() no plan! winners: "+str(winner))
-                #     winners.append(self.planner.openNodes[0])
+            winners = self.planner.openNodes.popBest(self.planner.nodeBeamWidth)
         else:
             print("nodeSorter() No open nodes!")
         # print("nodeSorter() exit winners: "+str(winners))
@@ -1173,6 +1695,14 @@ class ObsPlanner:
         return bestVar
 
     def valSorter(self, node, var):
+        # the sorted choices only depend on the var's choices: beam siblings usually share the same var version
+        cacheKey = (var.version, self.valSelectorHeuristic)
+        cachedResult = self.valSorterCache.get(cacheKey)
+        if cachedResult is not None:
+            self.valSorterCache.move_to_end(cacheKey)
+            self.valSorterCacheHits += 1
+            return list(cachedResult) # callers may change the list
+        self.valSorterCacheMisses += 1
         result = []
         sortedChoices  = self.sortTpChoices(var) # returns tuples: (cmd, gpList, reward)
         # return sorted lists with non-empty gpLists (necessary check?)
@@ -1185,15 +1715,13 @@ class ObsPlanner:
             else:
                 print("empty choice: "+str(cmd))
         if result:
-            return result
+            self.valSorterCache[cacheKey] = result
+            if len(self.valSorterCache) > self.valSorterCacheSize:
+                self.valSorterCache.popitem(last=False)
+            return list(result)
         else:
             print("valSorter() ERROR! no choices!")
 
-
-    def sortNodesByPlanReward(self):
-        result = sorted(self.planner.openNodes, key=lambda x: x.planReward, reverse=True)
-        return result
-
 #===========================
 #   Multiple Observations
 
@@ -1299,6 +1827,7 @@ class ObsPlanner:
         print("\n\nSolution Summary "+timestamp)
         print("Global heuristic: " + str(self.nodeSorterHeuristic)+", Local Heuristic: "+self.valSelectorHeuristic+", Beam width: "+ str(self.planner.nodeBeamWidth) +", fixedPointing: "+str(self.fixedPointingOption))
         print("Max Tick: "+str(self.maxTick)+", multipleRoots: "+str(self.multipleRootNodes)+", useSortedGP: "+str(self.useSortedGP)+", sortedGPpct: "+str(self.sortedGPpct))
+        print("Search budgets: timeLimitMinutes: "+str(self.timeLimitMinutes)+", nodeLimit: "+str(self.nodeLimit)+", memoryLimitMB: "+str(self.memoryLimitMB)+", stopReason: "+str(self.planner.stopReason))
         print("Max Battery Charge: "+str(self.maxBatteryCharge)+" W-H, solarPowerIn: "+str(self.powerIn)+ " W")
         print("LowestEnergy: "+str(self.lowestEnergy))
         print("InitialPlan node count: "+str(self.initialPlanNodeCount)+", finalPlan node count: "+str(self.planner.nextNodeId))
@@ -1656,28 +2185,8 @@ class ObsPlanner:
 
 
     def readSlewTable(self):
-        filename = self.dataPath + "preprocessing/slewTable.txt"
-        print("Reading Slew Table: "+str(filename))
-        with open(filename, "r") as f:
-            firstLine = True
-            for line in f:
-                if firstLine:
-                    firstLine = False
-                else:
-                    terms = line.split(",")
-                    poFrom = int(terms[0].strip())
-                    poTo = int(terms[1].strip())
-                    time = float(terms[2].strip())
-                    energy = float(terms[3].strip())
-                    if not poFrom in self.slewTable:
-                        self.slewTable[poFrom] = {}
-                    col = self.slewTable[poFrom]
-                    col[poTo] = [time, energy]
-        tableKeys = list(self.slewTable.keys())
-        colCount = len(tableKeys)
-        firstCol = self.slewTable[tableKeys[0]]
-        rowCount = len(firstCol.keys())
-        print("  slew table size: "+str(rowCount)+" x "+str(colCount))
+        self.slewModel = slewModel.SlewModel(self.dataPath + "preprocessing/slewTable.txt")
+        self.slewTable = self.slewModel.slewTable
 
     def writePlanToFile(self, successNode, satId, timestamp):
         # uses self.plan
@@ -1718,7 +2227,7 @@ class ObsPlanner:
             priorEnergy = None
             minEnergyStep = None
             lastVar = None
-            for planStep in self.successNode.plan:
+            for planStep in self.successNode.iterPlan():
                 if planStep:
                     var = planStep[1]
                     lastVar = var
@@ -2402,22 +2911,13 @@ class ObsPlanner:
     def getPointingAngleFromChoice(self, choice):
         # if isinstance(choice, int):
         #     return choice
-        terms = str(choice).split(".")
-        return int(terms[1])
+        return slewModel.getPointingOption(choice)
 
     def updateSearchDepth(self, node):
         if node.parent:
             parentNode = self.planner.getNode(node.parent)
-            parentDepth = parentNode.state["depth"] if "depth" in parentNode.state else 0
-            node.state["depth"] = parentDepth + 1
-
-    def getVarsForTime(self, node, t):
-        #  multiple sats may have action at same time (though likely not same GP at same time)
-        vars = []
-        for var in node.unassignedVars:
-            if var.tick == t:
-                vars.append(var)
-        return vars
+            parentDepth = parentNode.state.get("depth", 0)
+            node.state = node.state.replace(depth=parentDepth + 1)
 
     def removeEmptyVars(self, node):
         varsToRemove = []
@@ -2428,10 +2928,7 @@ class ObsPlanner:
             node.unassignedVars.remove(v)
 
     def varHasChoices(self, var):
-        for choiceKey in var.choices:
-            if var.choices[choiceKey]:
-                return True
-        return False
+        return var.hasChoices()
 
     def loadPreprocessingResults(self):
         self.readSlewTable()
@@ -2543,8 +3040,7 @@ class ObsPlanner:
         return filename
 
     def getObsCount(self, cmd):
-        count = cmd.count(".")
-        return count
+        return dshieldUtil.cmdObsCounts[dshieldUtil.getCmdId(cmd)]
 
 
 if __name__ == '__main__':
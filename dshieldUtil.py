@@ -41,22 +41,7 @@ def readMeasurementErrorTable(biomeId):
     return errorTable
 
 def getCmdErr(cmd, errTable):
-    rowIndex = None
-    choiceInfo = parseChoice(cmd)
-    payload1 = choiceInfo['payload']
-    angle1   = choiceInfo['pointingOption']
-    code1 = getErrorTableCode(angle1)
-    payload2 = choiceInfo['payload2'] if 'payload2' in choiceInfo else None
-    angle2 = choiceInfo['pointingOption2'] if 'pointingOption2' in choiceInfo else None
-    if not payload2:
-        if payload1 == 'L':
-            rowIndex = (code1,0)
-        else:
-            rowIndex = (0, code1)
-    else:
-        code2 = getErrorTableCode(angle2) # assumes payload1 is L, payload2 is P
-        rowIndex = (code1, code2)
-    return getError(rowIndex, errTable)
+    return getError(cmdErrRows[getCmdId(cmd)], errTable)
 
 
 
@@ -209,22 +194,66 @@ def biomeLabel(type):
 
 def parseChoice(choice):
     result = {}
-    choice = choice.strip("'")
-    dotCount = choice.count(".")
-    if dotCount == 1:
-        payload, pointingOption = choice.split(".")
-        pointingOption = int(pointingOption)
-        errorTableCode = getErrorTableCode(pointingOption)
-        result.update({"payload": payload, "pointingOption": pointingOption, "errorCode": errorTableCode})
-    elif dotCount == 3:
-        p1, a1, p2, a2 = choice.split(".")
-        a1 = int(a1)
-        a2 = int(a2)
-        c1 = getErrorTableCode(a1)
-        c2 = getErrorTableCode(a2)
-        result.update({"payload": p1, "pointingOption": a1, "errorCode": c1, "payload2": p2, "pointingOption2": a2, "errorCode2": c2})
+    cmdId = getCmdId(choice)
+    if cmdPayloads[cmdId] is not None:
+        result.update({"payload": cmdPayloads[cmdId], "pointingOption": cmdPointingOptions[cmdId], "errorCode": cmdErrorCodes[cmdId]})
+        if cmdPayloads2[cmdId] is not None:
+            result.update({"payload2": cmdPayloads2[cmdId], "pointingOption2": cmdPointingOptions2[cmdId], "errorCode2": cmdErrorCodes2[cmdId]})
     return result
 
+# Command registry: each distinct cmd ("L.33", "'L.33'", "L.33.P.33") gets a small int id the first time it's seen
+# (ObsPlanner registers the event cmds when it creates the decision vars). The parsed cmd is kept in the lists below,
+# indexed by that id, so getCmdErr(), parseChoice() and the planner's hot paths index lists instead of parsing the cmd
+# cmds that aren't "payload.option" or "payload.option.payload2.option2" get None fields (parseChoice() returns {})
+PAYLOAD_MASKS = {"L": 1, "P": 2}
+cmdIds = {}               # cmd -> id
+cmdNames = []             # id -> cmd without quotes
+cmdPayloadMasks = []      # id -> PAYLOAD_MASKS bits of the cmd's payloads
+cmdPayloads = []          # id -> payload, cmdPayloads2: second payload (None for single obs)
+cmdPayloads2 = []
+cmdPointingOptions = []   # id -> pointing option, cmdPointingOptions2: second payload's option
+cmdPointingOptions2 = []
+cmdErrorCodes = []        # id -> getErrorTableCode() of the option, cmdErrorCodes2: of the second option
+cmdErrorCodes2 = []
+cmdObsCounts = []         # id -> observations (1 or 2)
+cmdErrRows = []           # id -> measurement error table row (getCmdErr())
+
+def getCmdId(cmd):
+    cmdId = cmdIds.get(cmd)
+    if cmdId is None:
+        cmdId = registerCmd(cmd)
+    return cmdId
+
+def registerCmd(cmd):
+    name = cmd.strip("'")
+    cmdId = cmdIds.get(name)
+    if cmdId is None:
+        cmdId = len(cmdNames)
+        terms = name.split(".")
+        payload = payload2 = option = option2 = code = code2 = errRow = None
+        if len(terms) == 2:
+            payload, option = terms[0], int(terms[1])
+            code = getErrorTableCode(option)
+            errRow = (code, 0) if payload == 'L' else (0, code)
+        elif len(terms) == 4:
+            payload, option, payload2, option2 = terms[0], int(terms[1]), terms[2], int(terms[3])
+            code = getErrorTableCode(option)
+            code2 = getErrorTableCode(option2) # assumes payload1 is L, payload2 is P
+            errRow = (code, code2)
+        cmdNames.append(name)
+        cmdPayloadMasks.append(PAYLOAD_MASKS.get(payload, 0) | PAYLOAD_MASKS.get(payload2, 0))
+        cmdPayloads.append(payload)
+        cmdPayloads2.append(payload2)
+        cmdPointingOptions.append(option)
+        cmdPointingOptions2.append(option2)
+        cmdErrorCodes.append(code)
+        cmdErrorCodes2.append(code2)
+        cmdObsCounts.append(len(terms) // 2)
+        cmdErrRows.append(errRow)
+        cmdIds[name] = cmdId
+    cmdIds[cmd] = cmdId
+    return cmdId
+
 def convertDateTimeToFilenameFormat(inputFileDate, horizonId):
     month = str(inputFileDate.month).rjust(2, "0")
     date = str(inputFileDate.day).rjust(2, "0")
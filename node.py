@@ -1,10 +1,62 @@
 from var import Var
+from varFrontier import VarFrontier
 # from hamiltonVar import Var
 
+class NodeState:
+    # Immutable node state: children share their parent's state and replace() copies only the changed fields,
+    # so creating a node doesn't depend on the state size. Reads like the old state dict (in, [], get, keys)
+    __slots__ = ("sat", "tick", "gpHash", "lastObs", "depth")
+
+    def __init__(self, sat=None, tick=None, gpHash=None, lastObs=None, depth=None):
+        object.__setattr__(self, "sat", sat)
+        object.__setattr__(self, "tick", tick)
+        object.__setattr__(self, "gpHash", gpHash)
+        object.__setattr__(self, "lastObs", lastObs) # satId -> (tick, pointing angle), replaced not updated
+        object.__setattr__(self, "depth", depth)
+
+    def replace(self, **changes):
+        fields = {field: getattr(self, field) for field in self.__slots__}
+        fields.update(changes)
+        return NodeState(**fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("NodeState is immutable, use replace(): "+str(name))
+
+    def __reduce__(self):
+        return (NodeState, tuple(getattr(self, field) for field in self.__slots__))
+
+    def keys(self):
+        return [field for field in self.__slots__ if getattr(self, field) is not None]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in self.__slots__ else None
+        return default if value is None else value
+
+    def __contains__(self, field):
+        return field in self.__slots__ and getattr(self, field) is not None
+
+    def __getitem__(self, field):
+        if field not in self:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __bool__(self):
+        return True
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+
 class Node:
-    def __init__(self, nodeId):
+    __slots__ = ("id", "unassignedVars", "status", "statusMsg", "parent", "children", "choice", "state", "planCons",
+                 "choiceReward", "planReward", "var", "depth", "distance", "discrepancies")
+
+    def __init__(self, nodeId, unassignedVars=None):
         self.id = nodeId
-        self.unassignedVars = list()
+        self.unassignedVars = unassignedVars if unassignedVars is not None else VarFrontier()
         # self.assignedVars = list()
         self.status = "open"
         self.statusMsg = None
@@ -13,19 +65,42 @@ class Node:
         self.choice = None
         # self.score = None
         self.state = None
-        self.plan = list()
+        self.planCons = None # plan steps as a cons list shared with the ancestors: (last step, parent's planCons)
         self.choiceReward = 0
         self.planReward = 0
         self.var = None
         self.depth = 0
         self.distance = 0
+        self.discrepancies = 0 # non-first choices on the path from the root (limited discrepancy search)
         # print("node() id: " + str(self.id))
 
-    def addVar(self, name, choices, objective=0):
-        v = Var(name, choices, objective)
+    def addVar(self, name, choices, objective=0, satId=None, tick=None):
+        v = Var(name, choices, objective, satId, tick)
         self.unassignedVars.append(v)
         return v
 
+    def addPlanStep(self, parentCons, step):
+        self.planCons = (step, parentCons)
+
+    def iterPlan(self):
+        # plan steps (parent id, assigned var) from the first to the last
+        steps = []
+        cons = self.planCons
+        while cons:
+            steps.append(cons[0])
+            cons = cons[1]
+        return reversed(steps)
+
+    @property
+    def plan(self):
+        return list(self.iterPlan())
+
+    @plan.setter
+    def plan(self, steps):
+        self.planCons = None
+        for step in steps:
+            self.planCons = (step, self.planCons)
+
     def getAssignedVar(self, name):
         for v in self.assignedVars:
             if v.name == name:
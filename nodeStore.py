@@ -0,0 +1,180 @@
+import collections
+import pickle
+import sqlite3
+
+from node import Node
+
+# Planit.allNodes: node id -> Node, with an optional on-disk tier
+# With a memoryNodeLimit the least recently used nodes beyond the limit are spilled to a SQLite file and loaded back
+# (into memory) when getNode() asks for them, e.g. while collectPlan() walks the parents of the success node.
+# Scans over many nodes (checkpoints, gap estimates) use readNode() instead, it doesn't load spilled nodes.
+# Only nodes accepted by canSpill are spilled (Planit.isNodeSpillable(): closed nodes and queued open nodes that were
+# already expanded, nothing else references them)
+# NOTE: a spilled node is saved without its plan steps (Planit.rebuildPlanCons() rebuilds them from the parents), an open
+# node keeps its unassigned vars as VarFrontier.pack() (the shared var table isn't saved), a closed node is never
+# expanded again and loses them. A loaded node is a new Node object
+
+class NodeStore:
+    def __init__(self, memoryNodeLimit=None, filepath=None, canSpill=None, rootFrontier=None):
+        self.memoryNodeLimit = memoryNodeLimit # None = keep every node in memory
+        self.filepath = filepath               # None = SQLite temporary file (deleted when closed)
+        self.canSpill = canSpill
+        self.rootFrontier = rootFrontier       # unpacks the frontiers of open nodes (same var table)
+        self.nodes = collections.OrderedDict() # in memory, least recently used first
+        self.connection = None
+        self.spilledCount = 0   # nodes in the file
+        self.spillWrites = 0
+        self.spillReads = 0
+        self.nextSpillSize = memoryNodeLimit
+
+    def openFile(self):
+        # "" = private temporary database, deleted by SQLite when the connection is closed
+        self.connection = sqlite3.connect(self.filepath or "")
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("DROP TABLE IF EXISTS nodes")
+        self.connection.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY, parent INTEGER, data BLOB)")
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+            self.spilledCount = 0
+
+    def __setitem__(self, nodeId, node):
+        self.nodes[nodeId] = node
+        if self.memoryNodeLimit:
+            self.nodes.move_to_end(nodeId)
+            if len(self.nodes) > self.nextSpillSize:
+                self.spill()
+
+    def __getitem__(self, nodeId):
+        node = self.nodes.get(nodeId)
+        if node is not None:
+            if self.memoryNodeLimit:
+                self.nodes.move_to_end(nodeId)
+            return node
+        node = self.loadNode(nodeId)
+        if node is None:
+            raise KeyError(nodeId)
+        self[nodeId] = node
+        return node
+
+    def get(self, nodeId, default=None):
+        if nodeId in self:
+            return self[nodeId]
+        return default
+
+    def __contains__(self, nodeId):
+        if nodeId in self.nodes:
+            return True
+        return self.spilledCount > 0 and self.connection.execute("SELECT 1 FROM nodes WHERE id = ?", (nodeId,)).fetchone() is not None
+
+    def __len__(self):
+        return len(self.nodes) + self.spilledCount
+
+    def getParentId(self, nodeId):
+        # parent id without loading a spilled node
+        if nodeId in self.nodes:
+            return self.nodes[nodeId].parent
+        if self.spilledCount:
+            row = self.connection.execute("SELECT parent FROM nodes WHERE id = ?", (nodeId,)).fetchone()
+            if row:
+                return row[0]
+        return None
+
+    def getPlanStep(self, nodeId):
+        # (parent id, var, plan steps or None if spilled) without loading a spilled node
+        node = self.nodes.get(nodeId)
+        if node is not None:
+            return (node.parent, node.var, node.planCons)
+        fields = pickle.loads(self.readRow(nodeId))
+        return (fields["parent"], fields["var"], None)
+
+    def readNode(self, nodeId):
+        # the node without loading it: the node in memory, or a copy of the spilled node that isn't kept
+        # (read only, for scans over many nodes, e.g. checkpoints and gap estimates)
+        node = self.nodes.get(nodeId)
+        if node is not None:
+            return node
+        return self.unpackNode(self.readRow(nodeId))
+
+    def setSpilledStatus(self, nodeId, status, statusMsg):
+        # closes a spilled node in the file (it loses its unassigned vars, like a spilled closed node)
+        fields = pickle.loads(self.readRow(nodeId))
+        fields["status"] = status
+        fields["statusMsg"] = statusMsg
+        fields.pop("unassignedVars", None)
+        with self.connection:
+            self.connection.execute("UPDATE nodes SET data = ? WHERE id = ?", (pickle.dumps(fields, pickle.HIGHEST_PROTOCOL), nodeId))
+
+    def readRow(self, nodeId):
+        row = self.connection.execute("SELECT data FROM nodes WHERE id = ?", (nodeId,)).fetchone() if self.spilledCount else None
+        if not row:
+            raise KeyError(nodeId)
+        return row[0]
+
+    def spill(self):
+        # writes the least recently used spillable nodes to the file until memoryNodeLimit is reached,
+        # in batches of 10% of the limit. Nodes that can't be spilled move to the most recently used end
+        batchSize = max(1, self.memoryNodeLimit // 10)
+        spillCount = len(self.nodes) - self.memoryNodeLimit + batchSize
+        rows = []
+        for nodeId in list(self.nodes):
+            if len(rows) >= spillCount:
+                break
+            node = self.nodes[nodeId]
+            if self.canSpill and not self.canSpill(node):
+                self.nodes.move_to_end(nodeId)
+                continue
+            rows.append((nodeId, node.parent, self.packNode(node)))
+            del self.nodes[nodeId]
+        if rows:
+            if not self.connection:
+                self.openFile()
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", rows)
+            self.spilledCount += len(rows)
+            self.spillWrites += len(rows)
+        # don't rescan the pinned nodes on every new node when few nodes could be spilled
+        self.nextSpillSize = max(self.memoryNodeLimit, len(self.nodes) + batchSize)
+
+    def loadNode(self, nodeId):
+        # removes the node from the file (it's written again if it's spilled again)
+        if not self.spilledCount:
+            return None
+        row = self.connection.execute("SELECT data FROM nodes WHERE id = ?", (nodeId,)).fetchone()
+        if not row:
+            return None
+        with self.connection:
+            self.connection.execute("DELETE FROM nodes WHERE id = ?", (nodeId,))
+        self.spilledCount -= 1
+        self.spillReads += 1
+        return self.unpackNode(row[0])
+
+    def packNode(self, node):
+        fields = {field: getattr(node, field) for field in Node.__slots__ if field not in ("unassignedVars", "planCons")}
+        if node.status == "open":
+            fields["unassignedVars"] = node.unassignedVars.pack()
+        return pickle.dumps(fields, pickle.HIGHEST_PROTOCOL)
+
+    def unpackNode(self, data):
+        fields = pickle.loads(data)
+        node = Node(fields["id"])
+        for field, value in fields.items():
+            if field == "unassignedVars":
+                value = self.rootFrontier.unpack(value)
+            setattr(node, field, value)
+        return node
+
+    def retain(self, nodeIds):
+        # drops every node (in memory or spilled) whose id isn't in nodeIds (see Planit.collectGarbage())
+        for nodeId in [nodeId for nodeId in self.nodes if nodeId not in nodeIds]:
+            del self.nodes[nodeId]
+        if self.spilledCount:
+            with self.connection:
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS keep (id INTEGER PRIMARY KEY)")
+                self.connection.execute("DELETE FROM keep")
+                self.connection.executemany("INSERT INTO keep VALUES (?)", ((nodeId,) for nodeId in nodeIds))
+                self.connection.execute("DELETE FROM nodes WHERE id NOT IN (SELECT id FROM keep)")
+            self.spilledCount = self.connection.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
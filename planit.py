@@ -1,20 +1,110 @@
 from node import Node
 from var import Var
+from checkpoint import CheckpointWriter, readCheckpoint, NO_VAR
+from nodeStore import NodeStore
 # from hamiltonVar import Var
 import time
 import gc
+import heapq
+import math
+import random
+import sys
+try:
+    import resource # not available on Windows (memoryLimit is ignored there)
+except ImportError:
+    resource = None
 
 import copy
 
+class OpenNodes:
+    # Heap-backed open list: O(log n) push and pop-best, lazy deletion for closed nodes.
+    # Heap entries are [key, nodeId, seq, live]. Removed entries stay in the heap with live = False
+    # and are skipped when popped. Ties are broken by node id, which matches the insertion order
+    # of the old list-based open list.
+    # Only node ids are kept, getNode(nodeId) returns the node (queued nodes may be spilled, see Planit.isNodeSpillable())
+    def __init__(self, keyFunction, getNode):
+        self.heap = []
+        self.entries = {}  # nodeId -> live heap entry
+        self.pending = []  # entries added since the last pop, keyed on flush (nodes are scored after they are created)
+        self.keyFunction = keyFunction
+        self.getNode = getNode
+        self.seq = 0
+
+    def append(self, node):
+        if node.id in self.entries:
+            return
+        self.seq += 1
+        entry = [None, node.id, self.seq, True]
+        self.entries[node.id] = entry
+        self.pending.append(entry)
+
+    def remove(self, node):
+        self.removeId(node.id)
+
+    def removeId(self, nodeId):
+        entry = self.entries.pop(nodeId, None)
+        if entry:
+            entry[-1] = False
+
+    def popBest(self, count=1):
+        result = []
+        self.flush()
+        while self.heap and len(result) < count:
+            entry = heapq.heappop(self.heap)
+            if entry[-1]:
+                del self.entries[entry[1]]
+                result.append(self.getNode(entry[1]))
+        return result
+
+    def peekBest(self):
+        self.flush()
+        while self.heap and not self.heap[0][-1]:
+            heapq.heappop(self.heap)
+        if self.heap:
+            return self.getNode(self.heap[0][1])
+
+    def flush(self):
+        for entry in self.pending:
+            if entry[-1]:
+                entry[0] = self.keyFunction(self.getNode(entry[1]))
+                heapq.heappush(self.heap, entry)
+        self.pending.clear()
+
+    def setKeyFunction(self, keyFunction):
+        # re-keys every open node, O(n)
+        self.keyFunction = keyFunction
+        self.flush()
+        self.heap = [entry for entry in self.heap if entry[-1]]
+        for entry in self.heap:
+            entry[0] = keyFunction(self.getNode(entry[1]))
+        heapq.heapify(self.heap)
+
+    def ids(self):
+        # open node ids (without loading spilled nodes)
+        return list(self.entries)
+
+    def __contains__(self, node):
+        return node.id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        for nodeId in list(self.entries):
+            yield self.getNode(nodeId)
+
+
 class Planit:
     def __init__(self):
         self.nodeBeamWidth = 1 # of nodes selected for expansion on each loop
         self.choiceBeamWidth = 1 #None (for a*/exhaustive) #1 # of choices selected on each node expansion (= # of child nodes created on each node expansion)
         self.nextNodeId = 0
         self.rootNode = None
-        self.openNodes = list()
-        self.allNodes = {}
-        self.successNodes = list()
+        self.openNodeKey = "dfs" # one of: planReward, depth, f, dfs, bfs (or a key function, see setOpenNodeKey())
+        self.openNodes = OpenNodes(self.nodeKeyDfs, self.getNode)
+        self.allNodes = NodeStore(canSpill=self.isNodeSpillable) # node id -> node (see setNodeStore())
+        self.successNodes = list() # collectGarbage() keeps only the best one (see getBestSuccessNode())
+        self.successCount = 0      # success nodes found (including the ones dropped from successNodes)
         # self.closedNodes = list()
         self.varSelector = None
         self.valSelector = None
@@ -23,11 +113,60 @@ class Planit:
         # self.gapEndPropagator = None
         # self.gapStartPropagator = None
         self.nodeSorter = None
+        self.nodeHeuristic = None # h for the "f" open node key (f = g + h, g = planReward)
         self.nodeScoringMethod = None
         self.stateUpdater = None
         self.successTest = None
         self.constraints = list()
         self.storeNodePlans    = True # default value
+        # anytime search: solveIt() stops at the first budget reached and returns the incumbent
+        self.timeLimit   = None # seconds
+        self.nodeLimit   = None # nodes created by this search
+        self.memoryLimit = None # MB (peak process RSS)
+        self.incumbent = None   # node with highest planReward so far (partial or full plan)
+        self.gapEstimate = None # best open bound - incumbent planReward (see estimateGap())
+        self.stopReason = None  # set when a budget stops the search
+        self.searchStartTime = None
+        self.searchStartNodeId = 0
+        self.sharedIncumbentReward = None # multiprocessing.Value shared by portfolio workers (best planReward of any worker)
+        self.incumbentListeners = list() # callbacks, called with an update dict for every improved incumbent
+        self.publishedIncumbent = None   # incumbent of the last update (the next update lists the steps changed since)
+        self.searchResult = None         # final node of iterIncumbents()
+        self.activeNodeSorter = None
+        self.mctsCandidates = []
+        # checkpoints (see writeCheckpoint() and resumeFromCheckpoint())
+        self.checkpointPath = None     # None = no checkpoints
+        self.checkpointInterval = 600  # seconds between checkpoints
+        self.checkpointWriter = None
+        self.lastCheckpointTime = None
+        self.resumedElapsed = 0        # search time before the resumed checkpoint
+        self.boundPruning = False # close nodes whose planReward + nodeHeuristic (an upper bound) can't beat the incumbent
+        # transposition table: nodes with the same nodeHasher key have the same remaining search, only the best one is kept open
+        self.nodeHasher = None
+        self.transpositionTable = {} # key -> (planReward, node id) of the best node seen with that key (ids: no node is kept alive)
+        self.transpositionHits = 0   # nodes closed as duplicates
+        # limited discrepancy search / restarts
+        self.collectSuccessNodes = False # keep searching after the first success, solveIt() returns the best success node
+        self.discrepancyLimit = None     # nodes whose next child would exceed this many discrepancies are closed
+        self.restartCount = 0            # > 0: randomized greedy dives from fresh copies of the start nodes (first dive is pure greedy)
+        self.restartSeed = 0
+        self.randomChoice = None         # random.Random, set during randomized dives
+        self.randomChoiceRate = 0.2      # probability of not taking the best choice in a randomized dive
+        self.randomChoiceCount = 3       # randomized choices are picked among the best randomChoiceCount choices
+        self.diveCount = 0
+        self.diveStartNodes = None
+        self.diveSuccessCount = 0
+        self.diveCutOff = False # a restart dive ends when its node is cut off (no backtracking)
+        # monte carlo tree search (see mctsStep())
+        self.mctsRolloutCount = 0   # > 0: rollouts per decision
+        self.mctsChoiceWidth = 4    # children (best choices) compared at each decision
+        self.mctsExploration = 1.0  # UCB1 exploration constant (values are normalized to [0, 1])
+        self.mctsBatchSize = 1      # rollouts requested from rolloutEvaluator at once (e.g. # of rollout processes)
+        self.rolloutEvaluator = None # callback: list of nodes -> estimated reward still available below each node
+        # node retention (see collectGarbage()): closed nodes that no kept node leads to are dropped from allNodes
+        self.keepFullTree = False       # True: keep every node (e.g. to print the whole tree with printTree())
+        self.gcNodeThreshold = 100000   # collect when allNodes grows past this (raised to 2x the nodes kept)
+        self.gcEvictedCount = 0
         # self.debug = True
         # self.vars = list()
 
@@ -36,32 +175,531 @@ class Planit:
         # gcThresholds = gc.get_threshold()
         # gc.set_threshold(100)
         # gcThresholds = gc.get_threshold()
-        nodeSorter = self.nodeSorterDefault
-        if self.nodeSorter:
-            nodeSorter = self.nodeSorter
-        while self.openNodes and not self.successNodes:
-            sortedNodes = nodeSorter()
-            # print("sorted nodes ("+str(len(sortedNodes))+"), beamWidth: "+str(self.beamWidth))
-            selectedNodes = sortedNodes[:self.nodeBeamWidth]
-            for n in selectedNodes:
-                # self.expandNodeBroadcast(n)
-                self.expandNodeDshield(n)
+        self.startSearch()
+        while self.searchStep():
+            pass
+        return self.finishSearch()
+
+    def startSearch(self):
+        self.activeNodeSorter = self.nodeSorter if self.nodeSorter else self.nodeSorterDefault
+        self.searchStartTime = time.time()
+        self.searchStartNodeId = self.nextNodeId
+        self.stopReason = None
+        self.publishedIncumbent = None
+        self.lastCheckpointTime = self.searchStartTime
+        if self.mctsRolloutCount:
+            self.mctsCandidates = list(self.openNodes) # start nodes (root or multiple root children)
+        elif self.restartCount:
+            self.initDives()
 
+    def searchStep(self):
+        # one iteration of the search loop, returns False when the search is done
+        if not self.keepFullTree and len(self.allNodes) > self.gcNodeThreshold:
+            self.collectGarbage()
+        if self.mctsRolloutCount:
+            return self.mctsStep()
+        if self.isDiveDone() and not self.startNextDive():
+            return False
+        if self.isBudgetExhausted():
+            return False
+        selectedNodes = self.activeNodeSorter() # pops the best nodeBeamWidth nodes from the open list
+        # print("selected nodes ("+str(len(selectedNodes))+"), beamWidth: "+str(self.nodeBeamWidth))
+        for n in selectedNodes:
+            if n.status != "open": # closed by mergeTransposition() while expanding a node of the same batch
+                continue
+            if self.isCutOff(n):
+                self.updateNodeStatus(n, "cutoff", "bound can't beat incumbent")
+                self.diveCutOff = self.restartCount > 0
+                continue
+            if self.discrepancyLimit is not None and n.discrepancies + len(n.children) > self.discrepancyLimit:
+                self.updateNodeStatus(n, "closed", "discrepancy limit")
+                continue
+            # self.expandNodeBroadcast(n)
+            self.expandNodeDshield(n)
+        # expanded nodes keep their remaining choices, so push them back unless they were closed
+        for n in selectedNodes:
+            if n.status == "open":
+                self.openNodes.append(n)
+        if self.checkpointPath and time.time() - self.lastCheckpointTime >= self.checkpointInterval:
+            self.writeCheckpoint()
+        return True
+
+    def iterIncumbents(self):
+        # runs the search like solveIt(), yielding an update for every improved incumbent (see getIncumbentUpdate())
+        # the final solveIt() result is left in self.searchResult
+        updates = []
+        self.incumbentListeners.append(updates.append)
+        try:
+            self.startSearch()
+            searching = True
+            while searching:
+                searching = self.searchStep()
+                pending = updates[:]
+                updates.clear()
+                yield from pending
+            self.searchResult = self.finishSearch()
+        finally:
+            self.incumbentListeners.remove(updates.append)
+
+    def finishSearch(self):
+        if self.checkpointWriter:
+            self.checkpointWriter.wait()
+        self.gapEstimate = self.estimateGap()
         if self.successNodes:
-            successNode = self.successNodes[0]
+            successNode = self.getBestSuccessNode()
             print("\nsolveIt() Success! Solution node: "+str(successNode)+"\n")
             print("\nsolveIt() Success! Node Count: "+str(self.nextNodeId)+"\n")
             # print(self.printTree(self.rootNode, 0))
             # print(self.printTree(None, 0))
             return successNode
+        elif self.incumbent:
+            if not self.stopReason:
+                self.stopReason = "open list exhausted" # e.g. all remaining nodes were cut off
+            print("\nsolveIt() Stopped at "+self.stopReason+"! Incumbent: "+str(self.incumbent)+", gap estimate: "+str(self.gapEstimate)+"\n")
+            print("\nsolveIt() Stopped! Node Count: "+str(self.nextNodeId)+", elapsed: "+format(time.time() - self.searchStartTime, '.3f')+" s\n")
+            return self.incumbent
+        elif self.stopReason:
+            print("\nsolveIt() Stopped at "+self.stopReason+" before any plan step was found!")
         else:
             print("\nsolveIt() INFEASIBLE!")
 
-    def addVar(self, name, choices, objective=0):
+    #==========================
+    #   Checkpoints: the open nodes and the incumbent are saved as chains of (var, choice) assignments from the root
+    #   (see checkpoint.py). Resuming replays the assignments with the same propagation as expandNodeDshield().
+    #   NOTE: restart dive counts and mcts decisions are not saved, a resumed search continues from the open nodes
+
+    def writeCheckpoint(self):
+        # snapshots the search in this thread, packs and writes it in the background. Skipped if the last write is still running
+        if not self.checkpointWriter or self.checkpointWriter.filepath != self.checkpointPath:
+            self.checkpointWriter = CheckpointWriter(self.checkpointPath)
+        if self.checkpointWriter.isBusy():
+            return False
+        self.lastCheckpointTime = time.time()
+        return self.checkpointWriter.write(self.createCheckpointSnapshot())
+
+    def createCheckpointSnapshot(self):
+        strings = []
+        stringIds = {}
+        chains = [(0, NO_VAR, 0)] # record 0 = root
+        chainIds = {self.rootNode.id: 0}
+        openNodes = []
+        for nodeId in sorted(self.openNodes.ids()): # replayed in id order so the dfs order is kept
+            node = self.allNodes.readNode(nodeId) # spilled open nodes aren't loaded back into memory
+            chainId = self.addCheckpointChain(node, chains, chainIds, strings, stringIds)
+            frontierVar = NO_VAR
+            frontierChoices = []
+            if node.unassignedVars:
+                var = node.unassignedVars[0]
+                frontierVar = self.getCheckpointStringId(var.name, strings, stringIds)
+                frontierChoices = [self.getCheckpointStringId(str(choice), strings, stringIds) for choice in var.choiceKeys()]
+            openNodes.append((chainId, node.discrepancies, frontierVar, frontierChoices))
+        incumbent = None
+        if self.incumbent:
+            incumbent = self.addCheckpointChain(self.incumbent, chains, chainIds, strings, stringIds)
+        return {"nodeCount": self.nextNodeId, "strings": strings, "chains": chains, "openNodes": openNodes,
+                "incumbent": incumbent, "elapsed": self.resumedElapsed + time.time() - self.searchStartTime}
+
+    def addCheckpointChain(self, node, chains, chainIds, strings, stringIds):
+        # returns the chain record of node, adding records for node and its ancestors not saved yet
+        path = []
+        while node.id not in chainIds:
+            path.append(node)
+            node = self.allNodes.readNode(node.parent)
+        for pathNode in reversed(path):
+            parent = self.allNodes.readNode(pathNode.parent)
+            if pathNode.var:
+                var = self.getCheckpointStringId(pathNode.var.name, strings, stringIds)
+                choice = self.getCheckpointStringId(str(pathNode.var.assignment[0]), strings, stringIds)
+            else: # start node (e.g. multiple root nodes)
+                var = NO_VAR
+                choice = parent.children.index(pathNode.id)
+            chainIds[pathNode.id] = len(chains)
+            chains.append((chainIds[parent.id], var, choice))
+        return chainIds[path[0].id] if path else chainIds[node.id]
+
+    def getCheckpointStringId(self, string, strings, stringIds):
+        if string not in stringIds:
+            stringIds[string] = len(strings)
+            strings.append(string)
+        return stringIds[string]
+
+    def resumeFromCheckpoint(self, filepath):
+        # replaces the open nodes with the checkpoint's open nodes (rebuilt from the root) and restores the incumbent
+        # the root vars, start nodes and callbacks must be set up as in the checkpointed run
+        checkpoint = readCheckpoint(filepath)
+        if not checkpoint:
+            return False
+        strings = checkpoint["strings"]
+        for n in list(self.openNodes):
+            self.openNodes.remove(n)
+            n.status = "closed"
+        nodes = [self.rootNode]
+        for parentId, varId, choiceId in checkpoint["chains"][1:]:
+            parent = nodes[parentId]
+            if varId == NO_VAR:
+                node = self.getNode(parent.children[choiceId])
+            else:
+                node = self.replayAssignment(parent, strings[varId], strings[choiceId])
+            if not node:
+                print("resumeFromCheckpoint() ERROR! checkpoint doesn't match the vars: "+str(filepath))
+                return False
+            node.status = "closed"
+            nodes.append(node)
+        for chainId, discrepancies, frontierVar, frontierChoices in checkpoint["openNodes"]:
+            node = nodes[chainId]
+            if frontierVar == NO_VAR:
+                node.unassignedVars.clear()
+            else:
+                self.restoreFrontier(node, strings[frontierVar], set(strings[i] for i in frontierChoices))
+            node.discrepancies = discrepancies
+            node.status = "open"
+            self.openNodes.append(node)
+        if checkpoint["incumbent"] is not None:
+            self.incumbent = nodes[checkpoint["incumbent"]]
+        self.resumedElapsed = checkpoint["elapsed"]
+        print("resumeFromCheckpoint() "+str(filepath)+": open nodes: "+str(len(self.openNodes))+", replayed nodes: "+str(len(nodes) - 1)+", incumbent: "+str(self.incumbent)+", elapsed before checkpoint: "+format(self.resumedElapsed, '.1f')+" s")
+        return True
+
+    def replayAssignment(self, parent, varName, choiceKey):
+        # recreates parent's child for var = choice, returns None if the var or choice isn't available
+        valSorter = self.valSorter if self.valSorter else self.valSorterDefault
+        for var in parent.unassignedVars:
+            if var.name == varName:
+                for choiceTuple in valSorter(parent, var):
+                    if str(choiceTuple[0]) == choiceKey:
+                        child = self.createAssignedChild(parent, var, choiceTuple)
+                        self.openNodes.remove(child)
+                        status, statusMsg = self.updateNodeState(child, var, choiceTuple)
+                        if status and self.testConstraints(child):
+                            self.updateNodeScore(child)
+                        return child
+                return None
+        return None
+
+    def restoreFrontier(self, node, varName, choiceKeys):
+        # drops the vars the checkpointed node had already passed and the frontier choices it had already tried
+        if varName not in [var.name for var in node.unassignedVars]:
+            print("restoreFrontier() ERROR! frontier var not found: "+varName+", node: "+str(node))
+            return
+        while node.unassignedVars[0].name != varName:
+            node.unassignedVars.remove(node.unassignedVars[0])
+        frontierVar = node.unassignedVars[0]
+        frontierVar = frontierVar.withoutChoices([choice for choice in frontierVar.choiceKeys() if str(choice) not in choiceKeys])
+        node.unassignedVars.replace(frontierVar)
+
+    #==========================
+    #   Monte Carlo tree search (mctsStep()): commit-style, each decision runs mctsRolloutCount rollouts spread over the candidate
+    #   nodes by UCB1 (value = planReward + rollout estimate), commits to the candidate with the best mean value
+    #   and closes the others. The candidates are the children for the best mctsChoiceWidth choices of the frontier var.
+
+    def mctsStep(self):
+        candidates = self.mctsCandidates
+        if not candidates or self.isBudgetExhausted():
+            return False
+        chosen = candidates[0]
+        if len(candidates) > 1:
+            chosen = self.selectByRollouts(candidates)
+        for n in candidates:
+            if n is not chosen:
+                self.updateNodeStatus(n, "closed", "mcts")
+        if not chosen.unassignedVars:
+            self.updateNodeStatus(chosen, "success")
+            self.mctsCandidates = []
+            return False
+        self.mctsCandidates = self.expandForMcts(chosen)
+        return True
+
+    def expandForMcts(self, node):
+        # returns the open children of node's next decision (or [node] if node has no vars left)
+        choiceBeamWidth = self.choiceBeamWidth
+        self.choiceBeamWidth = self.mctsChoiceWidth
+        children = []
+        while not children and node.unassignedVars and node.status == "open":
+            firstChild = len(node.children)
+            self.expandNodeDshield(node)
+            children = [self.getNode(childId) for childId in node.children[firstChild:]]
+            children = [child for child in children if child.status == "open"]
+        self.choiceBeamWidth = choiceBeamWidth
+        if node.status == "open":
+            self.updateNodeStatus(node, "closed", "mcts commit")
+        if not children and not node.unassignedVars:
+            node.status = "open"
+            return [node]
+        return children
+
+    def selectByRollouts(self, candidates):
+        count = len(candidates)
+        visits = [0] * count
+        totals = [0.0] * count
+        bounds = [None, None] # lowest and highest value seen (for normalization)
+        done = 0
+        while done < self.mctsRolloutCount:
+            batch = []
+            pending = [0] * count
+            for k in range(min(self.mctsBatchSize, self.mctsRolloutCount - done)):
+                i = self.selectUcb(visits, pending, totals, bounds, done + k)
+                pending[i] += 1
+                batch.append(i)
+            values = self.rolloutEvaluator([candidates[i] for i in batch])
+            for i, value in zip(batch, values):
+                value += candidates[i].planReward
+                visits[i] += 1
+                totals[i] += value
+                bounds[0] = value if bounds[0] is None else min(bounds[0], value)
+                bounds[1] = value if bounds[1] is None else max(bounds[1], value)
+            done += len(batch)
+        best = max(range(count), key=lambda i: (totals[i] / visits[i] if visits[i] else float("-inf"), -i))
+        print("selectByRollouts() candidates: "+str(count)+", rollouts: "+str(done)+", best: "+str(candidates[best])+", mean value: "+str(totals[best] / visits[best]))
+        return candidates[best]
+
+    def selectUcb(self, visits, pending, totals, bounds, rolloutCount):
+        # UCB1 over normalized mean values, pending rollouts count as visits (spreads a batch over the candidates)
+        bestIndex = None
+        bestUcb = None
+        low, high = bounds
+        for i in range(len(visits)):
+            n = visits[i] + pending[i]
+            if n == 0:
+                return i
+            normalizedMean = 1 # only pending rollouts: optimistic
+            if visits[i] and high > low:
+                normalizedMean = (totals[i] / visits[i] - low) / (high - low)
+            elif visits[i]:
+                normalizedMean = 0
+            ucb = normalizedMean + self.mctsExploration * math.sqrt(math.log(rolloutCount) / n)
+            if bestUcb is None or ucb > bestUcb:
+                bestIndex = i
+                bestUcb = ucb
+        return bestIndex
+
+    #==========================
+    #   Restarts: each dive searches from fresh copies of the start nodes until it finds a success node
+    #   (or runs out of open nodes). The incumbent and success nodes are kept across dives.
+
+    def isDiveDone(self):
+        if not self.openNodes or self.diveCutOff:
+            return True
+        return not self.collectSuccessNodes and self.successCount > self.diveSuccessCount
+
+    def initDives(self):
+        # the start nodes are kept unexpanded as templates for each dive
+        self.diveStartNodes = list(self.openNodes)
+        for n in self.diveStartNodes:
+            self.openNodes.remove(n)
+        self.diveCount = 0
+
+    def startNextDive(self):
+        # returns False when there are no dives left
+        if self.diveCount >= self.restartCount:
+            return False
+        self.closeOpenNodes("restart")
+        self.diveSuccessCount = self.successCount
+        self.diveCutOff = False
+        self.randomChoice = random.Random(self.restartSeed + self.diveCount) if self.diveCount else None
+        self.diveCount += 1
+        print("startNextDive() dive: "+str(self.diveCount)+"/"+str(self.restartCount)+", incumbent: "+str(self.incumbent))
+        for n in self.diveStartNodes:
+            self.createChildNode(n)
+        return True
+
+    def closeOpenNodes(self, statusMsg):
+        # spilled open nodes are closed in the node store without loading them
+        for nodeId in self.openNodes.ids():
+            if nodeId in self.allNodes.nodes:
+                self.updateNodeStatus(self.allNodes[nodeId], "closed", statusMsg)
+            else:
+                print("updateNodeStatus() n: "+str(nodeId)+" (spilled), status: closed, msg: "+statusMsg)
+                self.openNodes.removeId(nodeId)
+                self.allNodes.setSpilledStatus(nodeId, "closed", statusMsg)
+
+    def randomizeChoices(self, choiceTuples):
+        # randomized greedy: sometimes moves one of the next best choices to the front
+        if len(choiceTuples) > 1 and self.randomChoice.random() < self.randomChoiceRate:
+            choiceTuples = list(choiceTuples)
+            i = self.randomChoice.randrange(1, min(self.randomChoiceCount, len(choiceTuples)))
+            choiceTuples.insert(0, choiceTuples.pop(i))
+        return choiceTuples
+
+    #==========================
+    #   Anytime search
+
+    def isBudgetExhausted(self):
+        if self.timeLimit and time.time() - self.searchStartTime >= self.timeLimit:
+            self.stopReason = "time limit"
+        elif self.nodeLimit and self.nextNodeId - self.searchStartNodeId >= self.nodeLimit:
+            self.stopReason = "node limit"
+        elif self.memoryLimit and self.getMemoryUsage() >= self.memoryLimit:
+            self.stopReason = "memory limit"
+        return self.stopReason is not None
+
+    def getMemoryUsage(self):
+        # peak RSS in MB
+        if not resource:
+            return 0
+        maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            return maxRss / (1024 * 1024) # bytes on macOS
+        return maxRss / 1024 # kilobytes on Linux
+
+    def collectGarbage(self):
+        # mark: the open nodes, best success node, incumbent, mcts candidates, dive start nodes, the root and their ancestors
+        # (collectPlan(), exportPlan(), checkpoints and incumbent updates walk the ancestors). sweep: all other nodes
+        # only the best success node is kept (the one finishSearch() returns), e.g. lds and restarts find many
+        # NOTE: the children lists of kept nodes still have the ids of dropped nodes (see printTree())
+        # NOTE: expanded nodes stay open while they have choices left (dfs, beam and lds backtrack to them), so they
+        # and their ancestors are never dropped. setNodeStore() moves them out of memory instead
+        if len(self.successNodes) > 1:
+            self.successNodes = [self.getBestSuccessNode()]
+        keptNodes = self.successNodes + self.mctsCandidates + (self.diveStartNodes or [])
+        keptNodes += [self.rootNode, self.incumbent, self.publishedIncumbent]
+        keptNodeIds = self.openNodes.ids() + [node.id for node in keptNodes if node] # open nodes may be spilled
+        liveNodeIds = set()
+        for nodeId in keptNodeIds:
+            while nodeId and nodeId not in liveNodeIds:
+                liveNodeIds.add(nodeId)
+                nodeId = self.allNodes.getParentId(nodeId) # doesn't load spilled nodes
+        evictedCount = len(self.allNodes) - len(liveNodeIds)
+        self.allNodes.retain(liveNodeIds)
+        self.gcEvictedCount += evictedCount
+        self.gcNodeThreshold = max(self.gcNodeThreshold, 2 * len(liveNodeIds))
+        print("collectGarbage() kept nodes: "+str(len(liveNodeIds))+", dropped: "+str(evictedCount)+", next collection at: "+str(self.gcNodeThreshold))
+
+    def getBestSuccessNode(self):
+        return max(self.successNodes, key=lambda n: n.planReward) # first success node wins ties
+
+    def setNodeStore(self, memoryNodeLimit, filepath=None):
+        # keeps at most memoryNodeLimit nodes in memory, older closed nodes and queued expanded nodes are spilled to
+        # filepath (None = temporary file). The file is opened on the first spill (call this after forking workers)
+        nodeStore = NodeStore(memoryNodeLimit, filepath, self.isNodeSpillable, self.rootNode.unassignedVars if self.rootNode else None)
+        for nodeId in list(self.allNodes.nodes):
+            nodeStore[nodeId] = self.allNodes[nodeId]
+        self.allNodes.close()
+        self.allNodes = nodeStore
+
+    def isNodeSpillable(self, node):
+        # nodes that are referenced outside allNodes (nodes being expanded, unexpanded children, mcts candidates,
+        # dive start nodes, success nodes, incumbents, root) stay in memory, a spilled node comes back as a new object.
+        # Open nodes waiting in the open list after an expansion (they keep their remaining choices) are spilled
+        if node.status == "success" or node is self.rootNode:
+            return False
+        if node is self.incumbent or node is self.publishedIncumbent:
+            return False
+        if node.status == "open":
+            return bool(node.children) and node in self.openNodes and node not in self.mctsCandidates
+        return True
+
+    def updateIncumbent(self, node):
+        if not self.incumbent or node.planReward > self.incumbent.planReward:
+            self.incumbent = node
+            if self.incumbentListeners:
+                update = self.getIncumbentUpdate(node)
+                for listener in self.incumbentListeners:
+                    listener(update)
+            shared = self.sharedIncumbentReward
+            if shared is not None and node.planReward > shared.value:
+                with shared.get_lock():
+                    if node.planReward > shared.value:
+                        shared.value = node.planReward
+
+    def getIncumbentUpdate(self, node):
+        # returns {"nodeId", "planReward", "elapsed" (s), "baseNodeId", "newSteps"}
+        # plan steps up to baseNodeId are unchanged since the last update,
+        # newSteps [(nodeId, var, choiceReward, planReward)] replace the steps after it
+        prior = self.publishedIncumbent
+        newSteps = []
+        n = node
+        while n and not (prior and n.id == prior.id): # ids: ancestors loaded from the node store are new objects
+            if prior and prior.depth >= n.depth:
+                prior = self.getParentNode(prior)
+                continue
+            if n.var:
+                newSteps.append((n.id, n.var, n.choiceReward, n.planReward))
+            n = self.getParentNode(n)
+        newSteps.reverse()
+        self.publishedIncumbent = node
+        return {"nodeId": node.id, "planReward": node.planReward, "elapsed": time.time() - self.searchStartTime,
+                "baseNodeId": n.id if n else None, "newSteps": newSteps}
+
+    def isCutOff(self, node):
+        # True if node's optimistic value (planReward + nodeHeuristic) can't beat the incumbent (boundPruning)
+        # or the best reward found by another worker
+        # NOTE: needs an admissible nodeHeuristic, nodes are never cut off without one
+        if not self.nodeHeuristic or (not self.boundPruning and self.sharedIncumbentReward is None):
+            return False
+        # the incumbent itself is never cut off (its bound can equal its own planReward, also the shared reward it published)
+        if node is self.incumbent:
+            return False
+        bound = node.planReward + self.nodeHeuristic(node)
+        if self.boundPruning and self.incumbent and bound <= self.incumbent.planReward:
+            return True
+        return self.sharedIncumbentReward is not None and bound <= self.sharedIncumbentReward.value
+
+    def exportPlan(self, node):
+        # returns picklable plan steps [(var, choiceReward, planReward)] from the first assigned var down to node
+        steps = []
+        while node:
+            if node.var:
+                steps.append((node.var, node.choiceReward, node.planReward))
+            node = self.getParentNode(node)
+        steps.reverse()
+        return steps
+
+    def importPlan(self, planSteps):
+        # rebuilds plan steps from exportPlan() (e.g. found by a worker process) as a chain of closed nodes under the root
+        # returns the last node of the chain
+        parent = self.rootNode
+        for var, choiceReward, planReward in planSteps:
+            node = Node(self.getNextNodeId())
+            node.parent = parent.id
+            node.depth = parent.depth + 1
+            node.var = var
+            node.choiceReward = choiceReward
+            node.planReward = planReward
+            node.status = "imported"
+            parent.children.append(node.id)
+            self.allNodes[node.id] = node
+            if self.storeNodePlans:
+                node.addPlanStep(parent.planCons, (parent.id, var))
+            parent = node
+        return parent
+
+    def mergeTransposition(self, node):
+        # closes the dominated node (lower planReward) when node reaches the same search state as a node seen before
+        key = self.nodeHasher(node)
+        entry = self.transpositionTable.get(key)
+        if entry and entry[0] >= node.planReward:
+            self.transpositionHits += 1
+            self.updateNodeStatus(node, "duplicate", "dominated by "+str(entry[1]))
+            return
+        # the other node may have been dropped by collectGarbage() (it was closed then)
+        other = self.getNode(entry[1]) if entry and entry[1] in self.allNodes else None
+        if other and other.status == "open": # also a node being expanded (popped from the open list)
+            self.transpositionHits += 1
+            self.updateNodeStatus(other, "duplicate", "dominated by "+str(node.id))
+        self.transpositionTable[key] = (node.planReward, node.id)
+
+    def estimateGap(self):
+        # gap = best optimistic value (planReward + nodeHeuristic) over open nodes - incumbent planReward
+        # NOTE: only an upper bound on the remaining improvement if nodeHeuristic never underestimates
+        if not self.incumbent:
+            return None
+        bestBound = self.incumbent.planReward
+        for nodeId in self.openNodes.ids():
+            node = self.allNodes.readNode(nodeId)
+            h = self.nodeHeuristic(node) if self.nodeHeuristic else 0
+            bestBound = max(bestBound, node.planReward + h)
+        return bestBound - self.incumbent.planReward
+
+    def addVar(self, name, choices, objective=0, satId=None, tick=None):
         root = self.rootNode if self.rootNode else self.createNode()
-        v = self.rootNode.addVar(name, choices, objective)
+        v = self.rootNode.addVar(name, choices, objective, satId, tick)
         # self.vars.append(v)
 
+    def setLazyVars(self, keys, varFactory, lookaheadTicks=0):
+        # instead of addVar(): varFactory(satId, tick) creates each var when the search reaches it (see VarTable)
+        root = self.rootNode if self.rootNode else self.createNode()
+        self.rootNode.unassignedVars.setLazyVars(keys, varFactory, lookaheadTicks)
+
     def createNode(self):
         n = Node(self.getNextNodeId())
         if not self.rootNode:
@@ -76,19 +714,29 @@ class Planit:
             result = self.allNodes[nodeId]
         return result
 
+    def rebuildPlanCons(self, node):
+        # plan steps of a node loaded back from the node store (it's saved without them), from the nearest ancestor
+        # in memory that still has them. Spilled ancestors are read without loading them (see NodeStore.getPlanStep())
+        # NOTE: createChildNode() copies have no plan steps, like the root
+        steps = []
+        parentId, var, planCons = node.parent, node.var, None
+        while parentId:
+            steps.append((parentId, var))
+            parentId, var, planCons = self.allNodes.getPlanStep(parentId)
+            if planCons is not None:
+                break
+        for parentId, var in reversed(steps):
+            if var and var.assignment:
+                planCons = ((parentId, var), planCons)
+        node.planCons = planCons
+
     def getParentNode(self, node):
         if node.parent:
             return self.getNode(node.parent)
 
     def copyNode(self, n):
-        child = Node(self.getNextNodeId())
-        child.unassignedVars = n.unassignedVars.copy()
-        child.state = copy.deepcopy(n.state)
-
-        # stateCopy = {}
-        # for key in n.state.keys():
-        #     stateCopy[key] = copy.deepcopy(n.state[key])
-        # child.state = stateCopy #copy.deepcopy(n.state)
+        child = Node(self.getNextNodeId(), n.unassignedVars.copy())
+        child.state = n.state # immutable (NodeState), the state updater replaces it
         # child.plan = n.plan.copy() # TODO: remove this if unused
         child.var = n.var
         self.openNodes.append(child)
@@ -98,6 +746,27 @@ class Planit:
     def createChildNode(self, parent):
         child = self.copyNode(parent)
         child.parent = parent.id
+        child.depth = parent.depth + 1
+        parent.children.append(child.id)
+        return child
+
+    def createAssignedChild(self, parent, selectedVar, choiceTuple):
+        # creates parent's child for selectedVar = choiceTuple and propagates the choice
+        if self.storeNodePlans and parent.planCons is None and parent.parent:
+            self.rebuildPlanCons(parent) # parent was spilled (see isNodeSpillable())
+        child = self.copyNode(parent)
+        child.depth = parent.depth + 1
+        child.parent = parent.id
+        child.discrepancies = parent.discrepancies + len(parent.children)
+        childVar = copy.copy(selectedVar)
+        child.unassignedVars.remove(selectedVar)
+        childVar.assignment = choiceTuple
+        child.var = childVar
+        # propagate choice
+        if self.choicePropagator:
+            self.choicePropagator(child, childVar)
+        if self.storeNodePlans: # True by default
+            child.addPlanStep(parent.planCons, (parent.id, childVar))
         parent.children.append(child.id)
         return child
 
@@ -119,15 +788,9 @@ class Planit:
         tick = self.removeVarsEarlierThanTick(child5, tick + 5)
 
     def removeVarsEarlierThanTick(self, node, tick):
-        filteredVars = []
-        nextTick = None
-        for var in node.unassignedVars:
-            if var.tick > tick:
-                filteredVars.append(var)
-                if not nextTick:
-                    nextTick = var.tick
-        node.unassignedVars = filteredVars
-        return nextTick
+        node.unassignedVars.removeVarsUntilTick(tick)
+        if node.unassignedVars:
+            return node.unassignedVars[0].tick
 
     def varSelectorDefault(self, node):
         if node.unassignedVars:
@@ -148,14 +811,45 @@ class Planit:
         return result
 
     def nodeSorterDefault(self):
-        searchStrategy = "dfs"
+        # open list order is set by self.openNodeKey ("dfs" unless changed by setOpenNodeKey())
         if self.openNodes:
-            nodeIndex = 0 # breadthFirst
-            if searchStrategy == "dfs":
-                nodeIndex = len(self.openNodes)-1
-            return list(self.openNodes[nodeIndex])
+            return self.openNodes.popBest(self.nodeBeamWidth)
         else:
             print("nodeSorterDefault() No open nodes!")
+            return []
+
+    #==========================
+    #   Open node keys (smallest key is expanded first, ties go to the oldest node)
+
+    def nodeKeyPlanReward(self, node):
+        return -node.planReward
+
+    def nodeKeyDepth(self, node):
+        return -node.depth
+
+    def nodeKeyF(self, node):
+        # f = g + h, g = planReward, h = optimistic estimate of the reward still available below node
+        h = self.nodeHeuristic(node) if self.nodeHeuristic else 0
+        return -(node.planReward + h)
+
+    def nodeKeyDfs(self, node):
+        return -node.id # newest node first
+
+    def nodeKeyBfs(self, node):
+        return node.id # oldest node first
+
+    def nodeKeyLds(self, node):
+        # fewest discrepancies first (counting the discrepancy of node's next child), then deepest, then oldest
+        return (node.discrepancies + len(node.children), -node.depth, node.id)
+
+    def getOpenNodeKeyFunction(self, key):
+        keyFunctions = {"planReward": self.nodeKeyPlanReward, "depth": self.nodeKeyDepth, "f": self.nodeKeyF,
+                        "dfs": self.nodeKeyDfs, "bfs": self.nodeKeyBfs, "lds": self.nodeKeyLds}
+        if callable(key):
+            return key
+        if key not in keyFunctions:
+            print("getOpenNodeKeyFunction() ERROR! unknown open node key: "+str(key))
+        return keyFunctions[key]
 
     def expandNodeDshield(self, parent): #, gap=None):
         if parent.unassignedVars:
@@ -165,12 +859,10 @@ class Planit:
             valSorter   = self.valSorter   if self.valSorter else self.valSorterDefault
             selectedVar = varSelector(parent)
             if selectedVar:
-                varIndex = parent.unassignedVars.index(selectedVar)
                 # create a child for each choice
-                parentChoices = selectedVar.choices
                 childChoices = []
                 negativeRewardChoices = [] # choices with negative rewards
-                if len(parentChoices) > 0:
+                if selectedVar.choiceCount() > 0:
                     # dshield obs planner specific: TODO: move this out of planIt
                     choiceTuples = valSorter(parent, selectedVar) # returns sorted tuples of (cmd, gpList, reward) or (receiver1, receiver2) for broadcast
                     if not choiceTuples:
@@ -197,6 +889,8 @@ class Planit:
                             print("expandNode() valSorter pruned all choices! removing var from node: "+str(parent))
                         parent.unassignedVars.remove(selectedVar)
                         return
+                    if self.randomChoice:
+                        choiceTuples = self.randomizeChoices(choiceTuples)
                     # trim choices to beamwidth
                     if self.choiceBeamWidth:
                         choiceTuples = choiceTuples[:self.choiceBeamWidth] #self.beamWidth]
@@ -208,32 +902,13 @@ class Planit:
                             # dshield obs planner specific TODO: move this out of planIt
                             choice = choiceTuple[0]
                         childChoices.append(choice)
-                        child = self.copyNode(parent)
-                        child.depth = parent.depth + 1
-                        child.parent = parent.id
-                        child.plan = copy.copy(parent.plan)
-                        # find matching var for var in copied child
-                        for unassignedVar in child.unassignedVars:
-                            if unassignedVar.name == selectedVar.name:
-                                childVar = copy.copy(unassignedVar)
-                                child.unassignedVars.remove(unassignedVar)
-                                childVar.assignment = choiceTuple
-                                child.var = childVar
-
-                                # propagate choice
-                                if self.choicePropagator:
-                                    self.choicePropagator(child, childVar)
-                                break
-                            # else:
-                            #     print("expandNode() ERROR! var not found: "+str(v))
-                        if self.storeNodePlans: # True by default
-                            child.plan.append((parent.id, childVar))
-                        parent.children.append(child.id)
+                        child = self.createAssignedChild(parent, selectedVar, choiceTuple)
                         print("expandNode() parent: " + str(parent.id) +" -> child: " + str(child)+", choice: "+str(choice))
                         status, statusMsg = self.updateNodeState(child, selectedVar, choiceTuple)
                         if status:
                             if self.testConstraints(child):
                                 self.updateNodeScore(child)
+                                self.updateIncumbent(child)
                                 # TODO: move domain-specific logic out of planIt.
                                 # A* (dynamic programming): Prune nodes if same dist but higher cost
                                 # f = cost + dist
@@ -243,23 +918,19 @@ class Planit:
                                 if self.successTest and self.successTest(child):
                                     print("expandNode() SUCCESS! Goal state achieved: " + str(child))
                                     self.updateNodeStatus(child, "success")
+                                if self.nodeHasher and child.status == "open":
+                                    self.mergeTransposition(child)
                         else:
                             print("pruning infeasible node: "+str(child))
                             self.updateNodeStatus(child, "failed", statusMsg)
                           #  return
-                    # remove choice from parent's choice list (copy parent's var so change isn't inherited by children via pass by ref)
-                    parentVarCopy = copy.deepcopy(selectedVar)
-                    parentChoices = parentVarCopy.choices
-                    parent.unassignedVars[varIndex] = parentVarCopy
-                    for negativeRewardChoice in negativeRewardChoices:
-                        parentChoices.pop(negativeRewardChoice[0])
-                    for childChoice in childChoices:
-                        # TODO: move domain-specific logic out of planIt.
-                        parentChoices.pop(childChoice, None)  # removes choice from parent (n)
-
-                    if not parentChoices:
+                    # remove choices from parent's var (a new version of the var, the children keep the old one)
+                    removedChoices = [negativeRewardChoice[0] for negativeRewardChoice in negativeRewardChoices] + childChoices
+                    parentVar = selectedVar.withoutChoices(removedChoices)
+                    parent.unassignedVars.replace(parentVar)
+                    if not parentVar.choiceCount():
                         # print("expandNode() exhausted all parent choices! removing var from node: "+str(parent))
-                        parent.unassignedVars.remove(parentVarCopy)
+                        parent.unassignedVars.remove(parentVar)
                 else:
                     # mark parent exhausted after spawning children
                     self.updateNodeStatus(parent, "exhausted")
@@ -300,6 +971,7 @@ class Planit:
             self.openNodes.remove(n)
         if n.status == "success":
             self.successNodes.append(n)
+            self.successCount += 1
 
     def isRootChild(self, node):
         return node.id == self.rootNode.id
@@ -318,8 +990,22 @@ class Planit:
         self.nodeScoringMethod = scoringMethod
 
     def setNodeSorter(self, nodeSorter):
+        # nodeSorter() must pop (and return) the nodes selected for expansion from self.openNodes
         self.nodeSorter = nodeSorter
 
+    def setOpenNodeKey(self, key):
+        self.openNodeKey = key
+        self.openNodes.setKeyFunction(self.getOpenNodeKeyFunction(key))
+
+    def setNodeHeuristic(self, nodeHeuristic):
+        self.nodeHeuristic = nodeHeuristic
+
+    def setNodeHasher(self, nodeHasher):
+        self.nodeHasher = nodeHasher
+
+    def addIncumbentListener(self, listener):
+        self.incumbentListeners.append(listener)
+
     def setVarSelector(self, varSelector):
         self.varSelector = varSelector
 
@@ -355,6 +1041,8 @@ class Planit:
                 msg += "  "
             msg += str(node)
             for childId in node.children:
+                if childId not in self.allNodes:
+                    continue # dropped by collectGarbage() (see keepFullTree)
                 child = self.getNode(childId)
                 # RECURSIVE !!!
                 msg += self.printTree(child, level + 1)
@@ -0,0 +1,74 @@
+import math
+
+import numpy
+
+import dshieldUtil
+
+# Slew tables shared by the ObsPlanner propagator, the gap planner and the MILP builder, read once from slewTable.txt
+# (fromPO, toPO, time, energy) into arrays indexed by [fromOption, toOption]:
+#   slewTicks:  slew time rounded up to ticks (-1 = pair not in the file), slewEnergy: slew energy
+# slewTable keeps the file's values as read (float slew times) for the callers that use them directly
+# The *Rows lists are the same tables for scalar lookups (faster than indexing numpy arrays one item at a time), and
+#   feasibleRows: [fromOption][toOption][deltaTick] True if a cmd at toOption can start deltaTick ticks after a cmd at
+#               fromOption: same option, or deltaTick >= 2 (obs end) + slew ticks + 1 (next cmd start).
+#               Every deltaTick > maxDeltaTick is feasible (no slew takes more than maxSlewTime)
+# NOTE: feasibility is only looked up one choice at a time (choice sets have 1-4 cmds), so it's kept as lists only
+
+def getPointingOption(cmd):
+    # "L.33" -> 33, first payload's option of a dual cmd ("L.33.P.33")
+    return dshieldUtil.cmdPointingOptions[dshieldUtil.getCmdId(cmd)]
+
+
+class SlewModel:
+    def __init__(self, filename, maxSlewTime=22):
+        self.maxSlewTime = maxSlewTime
+        self.maxDeltaTick = 2 + maxSlewTime # slew starts 2 ticks after the cmd start
+        self.slewTable = {}
+        print("Reading Slew Table: "+str(filename))
+        with open(filename, "r") as f:
+            firstLine = True
+            for line in f:
+                if firstLine:
+                    firstLine = False
+                else:
+                    terms = line.split(",")
+                    poFrom = int(terms[0].strip())
+                    poTo = int(terms[1].strip())
+                    time = float(terms[2].strip())
+                    energy = float(terms[3].strip())
+                    if not poFrom in self.slewTable:
+                        self.slewTable[poFrom] = {}
+                    self.slewTable[poFrom][poTo] = [time, energy]
+        self.createTables()
+        print("  slew table size: "+str(len(self.slewTable))+" x "+str(len(next(iter(self.slewTable.values())))))
+
+    def createTables(self):
+        optionCount = max(max(self.slewTable), max(max(row) for row in self.slewTable.values())) + 1
+        self.slewTicks = numpy.full((optionCount, optionCount), -1, dtype=numpy.int32)
+        self.slewEnergy = numpy.zeros((optionCount, optionCount))
+        for poFrom, row in self.slewTable.items():
+            for poTo, (time, energy) in row.items():
+                self.slewTicks[poFrom, poTo] = math.ceil(time)
+                self.slewEnergy[poFrom, poTo] = energy
+        deltaTicks = numpy.arange(self.maxDeltaTick + 1)
+        sameOption = numpy.eye(optionCount, dtype=bool)[:, :, None]
+        known = (self.slewTicks >= 0)[:, :, None]
+        feasible = sameOption | (known & (deltaTicks >= 3 + self.slewTicks[:, :, None]))
+        self.slewTickRows = self.slewTicks.tolist()
+        self.slewEnergyRows = self.slewEnergy.tolist()
+        self.feasibleRows = feasible.tolist()
+
+    def getSlewTimeAndEnergy(self, fromOption, toOption):
+        # (slew ticks, slew energy)
+        slewTicks = self.slewTickRows[fromOption][toOption]
+        if slewTicks < 0:
+            raise KeyError((fromOption, toOption))
+        return (slewTicks, self.slewEnergyRows[fromOption][toOption])
+
+    def isFeasible(self, fromOption, toOption, deltaTick):
+        # True if a cmd at toOption can start deltaTick ticks after a cmd at fromOption
+        if deltaTick > self.maxDeltaTick:
+            return True
+        if deltaTick < 0:
+            return fromOption == toOption
+        return self.feasibleRows[fromOption][toOption][deltaTick]
@@ -0,0 +1,175 @@
+import datetime
+import os
+import random
+
+import pytest
+
+pytest.importorskip("payload") # gp.py (ObsPlanner's ground positions) needs the payload module
+
+from dshieldObsPlanner import ObsPlanner
+from gp import GP
+from var import Var
+import slewModel
+
+# ObsPlanner on small synthetic events (no data files): every gp has a 0.05 model error, the measurement error of a
+# cmd only depends on its error table codes (option 28-35: code 1, 22-27/36-41: code 2, 14-21/42-49: code 3),
+# so a gp's reward is 0.05 - 0.01 - 0.003 * L code - 0.002 * P code
+
+repoPath = os.path.dirname(os.path.abspath(__file__))
+
+
+def createObsPlanner(satEvents, strategy="dfs"):
+    # satEvents: satId -> {tick: {cmd: gp list}}
+    planner = ObsPlanner(sorted(satEvents), datetime.date(2020, 1, 5), 1, "test", None, strategy)
+    planner.statsInit()
+    planner.slewModel = slewModel.SlewModel(os.path.join(repoPath, "slewTable.txt"))
+    planner.slewTable = planner.slewModel.slewTable
+    errorTable = {(lCode, pCode): 0.01 + 0.003 * lCode + 0.002 * pCode for lCode in range(4) for pCode in range(4) if lCode or pCode}
+    planner.errorTable = {biome: errorTable for biome in range(1, 8)}
+    for satId, events in satEvents.items():
+        for tick, event in events.items():
+            for gpList in event.values():
+                for gpi in gpList:
+                    if gpi not in planner.gpDict:
+                        gp = GP(gpi, None, None, "1", "B1")
+                        gp.initialModelError = [(hour, 0.05) for hour in range(0, 24, 3)]
+                        planner.gpDict[gpi] = gp
+                    planner.gpDict[gpi].accessTimes.append(tick)
+                    planner.horizonGPs.add(gpi)
+        planner.satEvents[satId] = {tick: dict(event) for tick, event in events.items()}
+        planner.satEclipses[satId] = []
+    for gp in planner.gpDict.values():
+        gp.accessTimes = sorted(set(gp.accessTimes))
+    planner.writePlanToFile = lambda *args: None
+    planner.writePrettyPlanToFile = lambda *args: None
+    planner.createDecisionVars()
+    planner.createInitialState()
+    return planner
+
+
+def createRandomEvents(seed, satCount=2, eventCount=4, gpCount=8):
+    rng = random.Random(seed)
+    satEvents = {}
+    for satId in range(1, satCount + 1):
+        events = {}
+        for tick in sorted(rng.sample(range(0, 60), eventCount)):
+            events[tick] = {}
+            for j in range(rng.randint(1, 3)):
+                cmd = rng.choice("LP") + "." + str(rng.choice([14, 20, 24, 30, 33, 38, 45, 49]))
+                events[tick][cmd] = sorted(rng.sample(range(1, gpCount + 1), rng.randint(1, 3)))
+        satEvents[satId] = events
+    return satEvents
+
+
+def createStep(satId, tick, cmd, gpList):
+    var = Var("s" + str(satId) + "." + str(tick), {cmd: gpList}, 0, satId, tick)
+    var.assignment = (cmd, gpList, 0)
+    return (var, 0, 0)
+
+
+def getSteps(plan):
+    return [(var.name, var.assignment[0], list(var.assignment[1])) for var, choiceReward, planReward in plan]
+
+
+#===========================
+#   window decomposition (user-004)
+
+def test_getWindowCutsPicksTheLargestQuietGapNearEachSplit():
+    # sat 1 has vars at 0-9, 40-49 and 200-209, sat 2 at 0-9 and 44: the ticks 10-39 and 50-199 have no access
+    satEvents = {1: {tick: {"L.30": [tick + 1]} for tick in list(range(0, 10)) + list(range(40, 50)) + list(range(200, 210))},
+                 2: {tick: {"P.30": [tick + 1]} for tick in list(range(0, 10)) + [44]}}
+    planner = createObsPlanner(satEvents)
+    assert planner.getWindowCuts(1) == []
+    # both gaps are near the middle of the 30 distinct ticks, the larger one wins
+    assert planner.getWindowCuts(2) == [200]
+    assert planner.getWindowCuts(3) == [40, 200]
+    ticks = set(var.tick for var in planner.planner.rootNode.unassignedVars)
+    for cut in planner.getWindowCuts(3):
+        assert cut in ticks and cut - 1 not in ticks # each window starts after a quiet tick
+
+
+def test_getWindowCutsIgnoresGapsFarFromTheSplit():
+    # the 1-149 gap is the largest, but it's at the start (the split zone is around the 16th of 31 distinct ticks)
+    planner = createObsPlanner({1: {tick: {"L.30": [tick + 1]} for tick in [0] + list(range(150, 165)) + list(range(180, 195))}})
+    assert planner.getWindowCuts(2) == [180]
+
+
+def test_getWindowCutsSkipsSplitsWithoutAGap():
+    planner = createObsPlanner({1: {tick: {"L.30": [tick + 1]} for tick in range(0, 30)}})
+    assert planner.getWindowCuts(3) == []
+
+
+def test_stitchWindowPlansKeepsEachGpInItsBestStep():
+    planner = createObsPlanner({1: {0: {"L.30": [1, 2, 3, 4]}}})
+    firstWindow = [createStep(1, 10, "L.14", [1, 2]), createStep(1, 12, "L.14", [3])]
+    secondWindow = [createStep(2, 50, "L.30", [2, 3]), createStep(2, 100, "L.14", [1])]
+    plan = planner.stitchWindowPlans([firstWindow, secondWindow])
+    # L.30 (code 1) beats L.14 (code 3): gps 2 and 3 move to s2.50, s1.12 is left without gps, gp 1 ties and stays
+    # in the earlier step (s2.100 is left without gps)
+    assert getSteps(plan) == [("s1.10", "L.14", [1]), ("s2.50", "L.30", [2, 3])]
+    assert planner.stats["stitchDuplicateGps"] == 3
+    assert planner.stats["stitchSlewDrops"] == 0
+    rewards = [choiceReward for var, choiceReward, planReward in plan]
+    assert rewards == pytest.approx([0.05 - 0.019, 2 * (0.05 - 0.013)])
+    assert plan[-1][2] == pytest.approx(sum(rewards))
+
+
+def test_stitchWindowPlansDropsStepsThatCantBeReachedAcrossTheCut():
+    planner = createObsPlanner({1: {0: {"L.30": [1, 2, 3, 4]}}})
+    slewTicks = planner.slewModel.getSlewTimeAndEnergy(14, 49)[0]
+    assert 3 + slewTicks > 4
+    firstWindow = [createStep(1, 96, "L.14", [1])]
+    # s1.100 would need a slew from option 14 to 49, the same option at s1.101 needs none, s2.100 is another sat
+    secondWindow = [createStep(1, 100, "L.49", [2]), createStep(1, 101, "L.14", [3]), createStep(2, 100, "P.49", [4])]
+    plan = planner.stitchWindowPlans([firstWindow, secondWindow])
+    assert getSteps(plan) == [("s1.96", "L.14", [1]), ("s2.100", "P.49", [4]), ("s1.101", "L.14", [3])]
+    assert planner.stats["stitchSlewDrops"] == 1
+
+
+#===========================
+#   reward bounds (user-006)
+
+def getBestSuccessRewards(planner):
+    # node id -> best planReward of a success node below it (or the node itself)
+    best = {}
+    for node in planner.successNodes:
+        reward = node.planReward
+        while node:
+            if reward > best.get(node.id, float("-inf")):
+                best[node.id] = reward
+            node = planner.getParentNode(node)
+    return best
+
+
+def test_rewardBoundNeverUnderestimatesTheRewardBelowANode():
+    for seed in range(20):
+        planner = createObsPlanner(createRandomEvents(seed), "lds.20") # every plan
+        planner.keepFullTree = True
+        planner.createRewardBounds()
+        # each node's bound when it's first popped, where bound pruning checks it (an expanded node's frontier var
+        # only keeps its untried choices)
+        bounds = {}
+        def isCutOff(node):
+            bounds.setdefault(node.id, node.planReward + planner.getRewardBound(node))
+            return False
+        planner.planner.isCutOff = isCutOff
+        planner.solveIt()
+        best = getBestSuccessRewards(planner.planner)
+        assert len(planner.planner.successNodes) > 1
+        checkedNodes = 0
+        for nodeId, bound in bounds.items():
+            if nodeId in best:
+                assert bound >= best[nodeId] - 1e-9
+                checkedNodes += best[nodeId] > planner.planner.getNode(nodeId).planReward
+        assert checkedNodes > 0 # nodes with a better plan below them
+
+
+def test_boundPruningKeepsTheBestPlan():
+    for seed in range(20):
+        rewards = []
+        for boundPruning in (False, True):
+            planner = createObsPlanner(createRandomEvents(seed), "lds.20")
+            planner.boundPruning = boundPruning
+            planner.solveIt()
+            rewards.append(planner.successNode.planReward)
+        assert rewards[1] == pytest.approx(rewards[0])
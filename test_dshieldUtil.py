@@ -0,0 +1,44 @@
+import dshieldUtil
+
+
+def parseChoiceBefore(choice):
+    # dshieldUtil.parseChoice() before the cmd registry
+    result = {}
+    choice = choice.strip("'")
+    dotCount = choice.count(".")
+    if dotCount == 1:
+        payload, pointingOption = choice.split(".")
+        pointingOption = int(pointingOption)
+        result.update({"payload": payload, "pointingOption": pointingOption, "errorCode": dshieldUtil.getErrorTableCode(pointingOption)})
+    elif dotCount == 3:
+        p1, a1, p2, a2 = choice.split(".")
+        a1 = int(a1)
+        a2 = int(a2)
+        result.update({"payload": p1, "pointingOption": a1, "errorCode": dshieldUtil.getErrorTableCode(a1), "payload2": p2, "pointingOption2": a2, "errorCode2": dshieldUtil.getErrorTableCode(a2)})
+    return result
+
+
+def test_quotedAndUnquotedCmdsShareAnId():
+    cmdId = dshieldUtil.getCmdId("L.31")
+    assert dshieldUtil.getCmdId("'L.31'") == cmdId
+    assert dshieldUtil.getCmdId("L.31") == cmdId
+    assert dshieldUtil.cmdNames[cmdId] == "L.31"
+    assert dshieldUtil.getCmdId("P.31") != cmdId
+
+
+def test_parseChoiceMatchesTheParsedCmd():
+    cmds = ["L.14", "P.49", "'L.33'", "L.28.P.36", "'L.22.P.45'", "L.5", "X"]
+    for cmd in cmds:
+        assert dshieldUtil.parseChoice(cmd) == parseChoiceBefore(cmd)
+
+
+def test_registryFields():
+    cmdId = dshieldUtil.getCmdId("L.28.P.42")
+    assert dshieldUtil.cmdPayloadMasks[cmdId] == dshieldUtil.PAYLOAD_MASKS["L"] | dshieldUtil.PAYLOAD_MASKS["P"]
+    assert dshieldUtil.cmdObsCounts[cmdId] == 2
+    assert dshieldUtil.cmdErrRows[cmdId] == (1, 3)
+    cmdId = dshieldUtil.getCmdId("P.22")
+    assert dshieldUtil.cmdPayloadMasks[cmdId] == dshieldUtil.PAYLOAD_MASKS["P"]
+    assert dshieldUtil.cmdObsCounts[cmdId] == 1
+    assert dshieldUtil.cmdErrRows[cmdId] == (0, 2)
+    assert dshieldUtil.getCmdErr("P.22", {(0, 2): 0.25}) == 0.25
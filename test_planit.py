@@ -0,0 +1,153 @@
+import random
+
+from node import NodeState
+from planit import Planit
+
+# Planit searches on a small synthetic problem (sN.tick vars, cmd -> gp list choices, reward = gp count)
+# without the ObsPlanner callbacks: no propagation, so any assignment order is feasible
+
+
+def createPlanner(varCount=40, seed=1):
+    rng = random.Random(seed)
+    planner = Planit()
+    for i in range(varCount):
+        satId = i % 2 + 1
+        tick = i // 2 * 5
+        choices = {}
+        for j in range(rng.randint(1, 4)):
+            cmd = rng.choice("LP") + "." + str(rng.randint(14, 49))
+            choices[cmd] = sorted(rng.sample(range(1, 200), rng.randint(1, 5)))
+        planner.addVar("s" + str(satId) + "." + str(tick), choices, 0, satId, tick)
+    planner.setInitialState(NodeState())
+    planner.setValSorter(valSorter)
+    planner.setNodeScoringMethod(lambda node: scoreNode(planner, node))
+    planner.setSuccessTest(lambda node: not node.unassignedVars)
+    return planner
+
+
+def valSorter(node, var):
+    # (cmd, gp list, reward), best reward first
+    choices = [(cmd, gpList, len(gpList) + 1) for cmd, gpList in var.choices.items()]
+    choices.sort(key=lambda choice: (-choice[2], choice[0]))
+    return choices
+
+
+def scoreNode(planner, node):
+    node.choiceReward = node.var.assignment[2]
+    node.planReward = planner.getParentNode(node).planReward + node.choiceReward
+
+
+def setStrategy(planner, strategy):
+    if strategy == "lds":
+        planner.collectSuccessNodes = True
+        planner.discrepancyLimit = 1
+        planner.setOpenNodeKey("lds")
+    elif strategy == "beam":
+        planner.nodeBeamWidth = 3
+        planner.setOpenNodeKey("planReward")
+
+
+def getPlanSteps(planner, node):
+    return [(var.name, var.assignment[0]) for var, choiceReward, planReward in planner.exportPlan(node)]
+
+
+def solve(strategy, keepFullTree, nodeLimit=300, memoryNodeLimit=None):
+    planner = createPlanner()
+    setStrategy(planner, strategy)
+    planner.keepFullTree = keepFullTree
+    planner.gcNodeThreshold = 40
+    if memoryNodeLimit:
+        planner.setNodeStore(memoryNodeLimit)
+    planner.nodeLimit = nodeLimit
+    node = planner.solveIt()
+    return planner, node
+
+
+def test_collectGarbageDropsNodesWithoutChangingThePlan():
+    for strategy in ("lds", "beam"):
+        fullPlanner, fullNode = solve(strategy, True)
+        planner, node = solve(strategy, False)
+        assert getPlanSteps(planner, node) == getPlanSteps(fullPlanner, fullNode)
+        assert node.planReward == fullNode.planReward
+
+
+def test_collectGarbageKeepsOnlyTheBestSuccessNode():
+    fullPlanner, fullNode = solve("lds", True)
+    planner, node = solve("lds", False)
+    assert len(fullPlanner.successNodes) > 1
+    assert planner.successCount == len(fullPlanner.successNodes)
+    assert planner.gcEvictedCount > 0
+    assert len(planner.allNodes) < len(fullPlanner.allNodes)
+    assert len(planner.successNodes) < len(fullPlanner.successNodes)
+    assert node is planner.getBestSuccessNode()
+
+
+def test_nodeStoreSpillsAndRestoresNodesWithoutChangingThePlan():
+    for strategy in ("dfs", "lds", "beam"):
+        fullPlanner, fullNode = solve(strategy, True)
+        planner, node = solve(strategy, True, memoryNodeLimit=30)
+        assert planner.allNodes.spillWrites > 0
+        if strategy == "lds": # backtracks into spilled nodes
+            assert planner.allNodes.spillReads > 0
+        assert getPlanSteps(planner, node) == getPlanSteps(fullPlanner, fullNode)
+        assert node.planReward == fullNode.planReward
+        assert len(planner.allNodes) == len(fullPlanner.allNodes)
+        # plan steps of the success node were rebuilt through spilled (reloaded) parents
+        assert [(var.name, var.assignment[0]) for parentId, var in node.iterPlan()] == getPlanSteps(planner, node)
+
+
+def test_checkpointsAndGapEstimatesDontLoadSpilledNodes():
+    snapshots = []
+    for memoryNodeLimit in (None, 30):
+        planner, node = solve("lds", True, nodeLimit=200, memoryNodeLimit=memoryNodeLimit)
+        assert planner.stopReason
+        nodeStore = planner.allNodes
+        spillReads, memoryNodeCount = nodeStore.spillReads, len(nodeStore.nodes)
+        snapshot = planner.createCheckpointSnapshot()
+        del snapshot["elapsed"]
+        snapshots.append((snapshot, planner.estimateGap()))
+        assert (nodeStore.spillReads, len(nodeStore.nodes)) == (spillReads, memoryNodeCount)
+    assert snapshots[0] == snapshots[1]
+
+
+def test_checkpointResumeFindsTheSamePlan(tmp_path):
+    for strategy in ("dfs", "beam"):
+        fullPlanner, fullNode = solve(strategy, False, nodeLimit=None)
+        checkpointPath = str(tmp_path / (strategy + ".checkpoint"))
+        planner = createPlanner()
+        setStrategy(planner, strategy)
+        planner.checkpointPath = checkpointPath
+        planner.checkpointInterval = 0
+        planner.nodeLimit = 20
+        planner.solveIt()
+        assert planner.stopReason
+        assert planner.checkpointWriter.writeCount > 0
+        resumedPlanner = createPlanner()
+        setStrategy(resumedPlanner, strategy)
+        assert resumedPlanner.resumeFromCheckpoint(checkpointPath)
+        assert len(resumedPlanner.openNodes) > 0
+        node = resumedPlanner.solveIt()
+        # the resumed search starts from the replayed frontier, not from the root
+        assert 1 < resumedPlanner.searchStartNodeId
+        assert resumedPlanner.nextNodeId - resumedPlanner.searchStartNodeId < fullPlanner.nextNodeId - 1
+        assert getPlanSteps(resumedPlanner, node) == getPlanSteps(fullPlanner, fullNode)
+        assert node.planReward == fullNode.planReward
+
+
+def test_transpositionMergeSkipsClosedNodesOfTheSameBatch():
+    # nodes with the same parity of unassigned vars are "equivalent": expanding a node of a beam batch often closes
+    # another node of the batch, which must not be expanded anymore
+    planner = createPlanner()
+    planner.nodeBeamWidth = 3
+    planner.setOpenNodeKey("planReward")
+    planner.setNodeHasher(lambda node: node.unassignedVars.maxLen() % 2)
+    expandNode = planner.expandNodeDshield
+    expandedStatuses = []
+    def expandNodeDshield(node):
+        expandedStatuses.append(node.status)
+        expandNode(node)
+    planner.expandNodeDshield = expandNodeDshield
+    planner.nodeLimit = 300
+    planner.solveIt()
+    assert planner.transpositionHits > 0
+    assert expandedStatuses and set(expandedStatuses) == {"open"}
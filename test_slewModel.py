@@ -0,0 +1,37 @@
+import math
+import os
+
+from slewModel import SlewModel
+
+slewTablePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slewTable.txt")
+
+
+def isFeasibleBefore(slewTable, fromOption, toOption, deltaTick, maxSlewTime=22):
+    # ObsPlanner.removeInfeasibleSlewChoices() before the slew tables (vars more than maxSlewTime after the slew start
+    # weren't checked)
+    earliestSlewTick = 2
+    if fromOption == toOption or deltaTick >= earliestSlewTick + maxSlewTime + 1:
+        return True
+    slewTime = math.ceil(slewTable[fromOption][toOption][0])
+    return deltaTick >= earliestSlewTick + slewTime + 1
+
+
+def test_tablesMatchTheSlewTableFile():
+    slewModel = SlewModel(slewTablePath)
+    pairCount = 0
+    for fromOption, row in slewModel.slewTable.items():
+        for toOption, (time, energy) in row.items():
+            assert slewModel.getSlewTimeAndEnergy(fromOption, toOption) == (math.ceil(time), energy)
+            for deltaTick in range(-2, slewModel.maxDeltaTick + 3):
+                assert slewModel.isFeasible(fromOption, toOption, deltaTick) == isFeasibleBefore(slewModel.slewTable, fromOption, toOption, deltaTick)
+            pairCount += 1
+    assert pairCount == 3844
+
+
+def test_unknownPairsRaiseKeyError():
+    slewModel = SlewModel(slewTablePath)
+    try:
+        slewModel.getSlewTimeAndEnergy(0, 1)
+        assert False
+    except KeyError:
+        pass
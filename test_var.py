@@ -0,0 +1,56 @@
+import copy
+
+from var import Var
+
+
+def createVar():
+    return Var("s1.10", {"L.14": [1, 2], "P.33": [2, 3], "L.20": [4]})
+
+
+def test_withoutChoicesReturnsANewVersionSharingTheTable():
+    var = createVar()
+    newVar = var.withoutChoices(["P.33", "X.1"])
+    assert newVar is not var
+    assert newVar.table is var.table
+    assert newVar.version != var.version
+    assert newVar.choices == {"L.14": [1, 2], "L.20": [4]}
+    assert newVar.choiceKeys() == ["L.14", "L.20"]
+    assert newVar.choiceCount() == 2
+    assert var.choices == {"L.14": [1, 2], "P.33": [2, 3], "L.20": [4]}
+    assert var.withoutChoices(["X.1"]) is var
+    assert newVar.withoutChoices(["P.33"]) is newVar
+
+
+def test_withoutRemovesGpsAndEmptiedChoices():
+    var = createVar()
+    newVar, emptyChoices, removedKeys = var.without(["L.14"], [(2, ["L.14", "P.33"]), (4, ["L.20"])])
+    assert newVar.choices == {"P.33": [3]}
+    assert emptyChoices == [(4, "L.20")]
+    assert removedKeys == ["L.14"]
+    assert newVar.version != var.version
+    assert var.removedGps is None and var.removedChoices == 0
+    assert newVar.hasChoices()
+    # gps that the choices don't observe (or already lost) don't make a new version
+    assert newVar.without(gps=[(2, ["P.33"]), (9, ["P.33"])]) == (newVar, [], [])
+    lastVar, emptyChoices, removedKeys = newVar.without(gps=[(3, ["P.33"])])
+    assert lastVar.choices == {}
+    assert emptyChoices == [(3, "P.33")]
+    assert not lastVar.hasChoices()
+
+
+def test_copiesShareTheVersion():
+    var = createVar().withoutChoices(["L.20"])
+    varCopy = copy.copy(var)
+    varCopy.assignment = ("L.14", [1, 2], 3)
+    assert varCopy.version == var.version
+    assert varCopy.choices == var.choices
+    assert var.assignment is None
+
+
+def test_withRemovalsRestoresAVersion():
+    var = createVar()
+    newVar = var.without(["L.20"], [(1, ["L.14"])])[0]
+    assert var.withRemovals(var.getRemovals()) is var
+    restored = var.withRemovals(newVar.getRemovals())
+    assert restored.version == newVar.version
+    assert restored.choices == newVar.choices == {"L.14": [2], "P.33": [2, 3]}
@@ -0,0 +1,145 @@
+import pickle
+
+from var import Var
+from varFrontier import VarFrontier
+
+# vars s1.0, s2.0, s1.5, s2.5, ... s2.45 (tick-sorted, two satellites), choices cmd -> gp list
+
+
+def createFrontier(tickCount=10):
+    frontier = VarFrontier()
+    for tick in range(0, tickCount * 5, 5):
+        for satId in (1, 2):
+            frontier.append(Var("s" + str(satId) + "." + str(tick), {"L.14": [tick, tick + 1], "P.33": [tick + 2]}))
+    return frontier
+
+
+def getNames(vars):
+    return [var.name for var in vars]
+
+
+def test_removeAdvancesTheCursorPastRemovedVars():
+    frontier = createFrontier()
+    first, second, third = frontier[0], frontier[1], frontier[2]
+    frontier.remove(second)
+    assert frontier.cursor == 0
+    assert frontier.overlay == {second.index: None}
+    assert second not in frontier
+    frontier.remove(first)
+    # the cursor skips the removed var and drops its overlay entry
+    assert frontier.cursor == third.index
+    assert frontier.overlay == {}
+    assert frontier[0] is third
+    assert len(frontier) == 18
+
+
+def test_copyDoesNotShareChangesWithTheParent():
+    parent = createFrontier()
+    child = parent.copy()
+    var = child[3]
+    newVar = var.withoutChoices(["P.33"])
+    child.replace(newVar)
+    child.remove(child[0])
+    assert child.table is parent.table
+    assert child.getVar(var.index) is newVar
+    assert parent.getVar(var.index) is var
+    assert len(parent) == 20
+    assert len(child) == 19
+
+
+def test_replaceRejectsVarsOutsideTheFrontier():
+    frontier = createFrontier()
+    var = frontier[0]
+    frontier.remove(var)
+    try:
+        frontier.replace(var.withoutChoices(["P.33"]))
+        assert False
+    except ValueError:
+        pass
+    try:
+        frontier.remove(var)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_removeVarsUntilTickAndKeepTickRange():
+    frontier = createFrontier()
+    frontier.replace(frontier[1].withoutChoices(["L.14"]))
+    frontier.replace(frontier[5].withoutChoices(["L.14"]))
+    frontier.removeVarsUntilTick(5)
+    assert getNames(frontier)[:2] == ["s1.10", "s2.10"]
+    assert list(frontier.overlay) == [5]
+    frontier.keepTickRange(15, 30)
+    assert getNames(frontier) == ["s1.15", "s2.15", "s1.20", "s2.20", "s1.25", "s2.25"]
+    assert frontier.overlay == {}
+    assert frontier.maxLen() == 6
+    assert frontier[-1].name == "s2.25"
+    frontier.clear()
+    assert not frontier
+    assert len(frontier) == 0
+
+
+def test_varsInTickRangeAndGetVarAt():
+    frontier = createFrontier()
+    frontier.removeVarsUntilTick(0)
+    frontier.remove(frontier.getVarAt(2, 10))
+    assert getNames(frontier.varsInTickRange(0, 15)) == ["s1.5", "s2.5", "s1.10"]
+    assert getNames(frontier.varsInTickRange(5, 20, 2)) == ["s2.5", "s2.15"]
+    assert getNames(frontier.varsInTickRange(50, 60)) == []
+    assert frontier.getVarAt(1, 10).name == "s1.10"
+    assert frontier.getVarAt(2, 10) is None # removed
+    assert frontier.getVarAt(1, 0) is None  # before the cursor
+    assert frontier.getVarAt(1, 7) is None  # no var at that tick
+    assert frontier.getVarAt(3, 10) is None # no such satellite
+    frontier.keepTickRange(0, 20)
+    assert frontier.getVarAt(1, 20) is None # after the end
+    assert getNames(frontier.varsInTickRange(0, 100, 1)) == ["s1.5", "s1.10", "s1.15"]
+
+
+def test_varsInTickRangeStartsAtTheCursor():
+    frontier = createFrontier()
+    frontier.remove(frontier[0]) # the cursor is at s2.0, between sat 1's vars
+    assert getNames(frontier.varsInTickRange(0, 10)) == ["s2.0", "s1.5", "s2.5"]
+    assert getNames(frontier.varsInTickRange(0, 10, 1)) == ["s1.5"]
+    assert getNames(frontier.varsInTickRange(0, 10, 2)) == ["s2.0", "s2.5"]
+
+
+def test_packAndUnpackRestoreTheFrontier():
+    frontier = createFrontier()
+    frontier.removeVarsUntilTick(0)
+    frontier.keepTickRange(0, 40)
+    frontier.remove(frontier[2])
+    var, gpVar = frontier[3], frontier[4]
+    frontier.replace(var.withoutChoices(["P.33"]))
+    newGpVar = gpVar.without(gps=[(gpVar.tick, ["L.14"])])[0]
+    frontier.replace(newGpVar)
+    packed = pickle.loads(pickle.dumps(frontier.pack()))
+    restored = frontier.unpack(packed)
+    assert restored.table is frontier.table
+    assert (restored.cursor, restored.end) == (frontier.cursor, frontier.end)
+    assert getNames(restored) == getNames(frontier)
+    assert [var.choices for var in restored] == [var.choices for var in frontier]
+    assert restored.getVar(newGpVar.index).version == newGpVar.version
+    assert restored.getVar(newGpVar.index).choices == {"L.14": [newGpVar.tick + 1], "P.33": [newGpVar.tick + 2]}
+
+
+def test_lazyVarsAreCreatedWhenTheFrontierReadsThem():
+    created = []
+    def createVar(satId, tick):
+        created.append((satId, tick))
+        if tick == 10:
+            return None # an event without choices
+        return Var("s" + str(satId) + "." + str(tick), {"L.14": [tick]})
+    frontier = VarFrontier()
+    frontier.setLazyVars([(satId, tick) for tick in range(0, 50, 5) for satId in (1, 2)], createVar, lookaheadTicks=5)
+    assert frontier.maxLen() == 20
+    assert frontier[0].name == "s1.0"
+    assert created == [(1, 0), (2, 0), (1, 5), (2, 5)]
+    assert frontier.getVarAt(2, 20).name == "s2.20"
+    assert created[4:] == [(2, 20), (1, 25), (2, 25)] # with the vars up to lookaheadTicks later
+    frontier.removeVarsUntilTick(5)
+    # the two empty events at tick 10 are skipped
+    assert frontier[0].name == "s1.15"
+    assert len(frontier) == 14
+    assert frontier.table.materializedCount == 20
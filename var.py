@@ -1,11 +1,166 @@
+import copy
+import itertools
+
+
+versionCounter = itertools.count(1) # var versions (a version's choices never change)
+
+
+class ChoiceTable:
+    # the choices (choice key -> gp list) a var was created with, shared read-only by every version of the var
+    __slots__ = ("keys", "gpLists", "keyIndex", "choices")
+
+    def __init__(self, choices):
+        self.choices = choices
+        self.keys = list(choices.keys())
+        self.gpLists = [choices[key] for key in self.keys]
+        self.keyIndex = {key: i for i, key in enumerate(self.keys)}
+
+    def getKeyChoices(self, gpi, choiceKeys):
+        # indexes of the choices in choiceKeys that observe gpi
+        indexes = []
+        for key in choiceKeys:
+            i = self.keyIndex.get(key)
+            if i is not None and gpi in self.gpLists[i]:
+                indexes.append(i)
+        return indexes
+
+
 class Var:
-    def __init__(self, name, choices, objective=0):
+    # Vars are shared between nodes, don't change their choices: withoutChoices() and without() return a new version
+    # of the var that only stores what was removed from the shared ChoiceTable (a bitmask of removed choices and the
+    # gps removed from each choice). var.choices is a dict view of the remaining choices, built when it's first read
+    __slots__ = ("name", "table", "removedChoices", "removedGps", "cachedChoices", "version", "assignment", "satId", "tick", "index")
+
+    def __init__(self, name, choices, objective=0, satId=None, tick=None):
         self.name = name
-        self.choices = choices
+        self.table = ChoiceTable(choices)
+        self.removedChoices = 0   # bit i set: table.keys[i] was removed
+        self.removedGps = None    # None or {choice index: frozenset of the gps removed from the choice}
+        self.cachedChoices = choices
+        self.version = next(versionCounter) # unique id of the var's choices (copies share it, new versions don't)
         self.assignment = None
-        self.satId = None
-        self.tick = None
-        self.parseName()
+        self.satId = satId # int
+        self.tick = tick   # int
+        self.index = None  # position in the shared var list (see VarFrontier)
+        if satId is None or tick is None:
+            self.parseName()
+
+    def __copy__(self):
+        # shares the choice table like the default shallow copy, without copy's generic reduce/reconstruct
+        result = Var.__new__(Var)
+        result.name = self.name
+        result.table = self.table
+        result.removedChoices = self.removedChoices
+        result.removedGps = self.removedGps
+        result.cachedChoices = self.cachedChoices
+        result.version = self.version
+        result.assignment = self.assignment
+        result.satId = self.satId
+        result.tick = self.tick
+        result.index = self.index
+        return result
+
+    @property
+    def choices(self):
+        # choice key -> gp list of the remaining choices (read only)
+        if self.cachedChoices is None:
+            table = self.table
+            removedGps = self.removedGps or {}
+            choices = {}
+            for i, key in enumerate(table.keys):
+                if not self.removedChoices >> i & 1:
+                    gpList = table.gpLists[i]
+                    if i in removedGps:
+                        gpList = [gpi for gpi in gpList if gpi not in removedGps[i]]
+                    choices[key] = gpList
+            self.cachedChoices = choices
+        return self.cachedChoices
+
+    def choiceKeys(self):
+        # remaining choice keys (without building the gp lists)
+        if self.cachedChoices is not None:
+            return list(self.cachedChoices.keys())
+        return [key for i, key in enumerate(self.table.keys) if not self.removedChoices >> i & 1]
+
+    def choiceCount(self):
+        return len(self.table.keys) - bin(self.removedChoices).count("1")
+
+    def hasChoices(self):
+        # True if a remaining choice still observes a gp
+        removedGps = self.removedGps or {}
+        for i, gpList in enumerate(self.table.gpLists):
+            if not self.removedChoices >> i & 1 and len(gpList) > len(removedGps.get(i, ())):
+                return True
+        return False
+
+    def withoutChoices(self, choiceKeys):
+        # returns a new version of the var without choiceKeys (keys it doesn't have are ignored)
+        removedChoices = self.removedChoices
+        for key in choiceKeys:
+            i = self.table.keyIndex.get(key)
+            if i is not None:
+                removedChoices |= 1 << i
+        if removedChoices == self.removedChoices:
+            return self
+        result = copy.copy(self)
+        result.removedChoices = removedChoices
+        result.cachedChoices = None
+        result.version = next(versionCounter)
+        return result
+
+    def without(self, choiceKeys=(), gps=()):
+        # removes each gpi of gps [(gpi, keys of the choices that may observe it)] from those choices (choices left without
+        # gps are removed), then withoutChoices(choiceKeys), as one new version
+        # returns (new version or self, [(gpi, key)] of the choices left without gps, the choiceKeys that were removed)
+        table = self.table
+        removedChoices = self.removedChoices
+        removedGps = self.removedGps
+        copiedGps = False
+        emptyChoices = []
+        for gpi, gpChoiceKeys in gps:
+            for i in table.getKeyChoices(gpi, gpChoiceKeys):
+                if removedChoices >> i & 1:
+                    continue
+                choiceRemovedGps = removedGps.get(i, frozenset()) if removedGps else frozenset()
+                if gpi in choiceRemovedGps:
+                    continue
+                if not copiedGps:
+                    removedGps = dict(removedGps or {})
+                    copiedGps = True
+                removedGps[i] = choiceRemovedGps | {gpi}
+                if len(removedGps[i]) >= len(table.gpLists[i]):
+                    removedChoices |= 1 << i
+                    emptyChoices.append((gpi, table.keys[i]))
+        removedKeys = []
+        for key in choiceKeys:
+            i = table.keyIndex.get(key)
+            if i is not None and not removedChoices >> i & 1:
+                removedChoices |= 1 << i
+                removedKeys.append(key)
+        if not copiedGps and removedChoices == self.removedChoices:
+            return (self, emptyChoices, removedKeys)
+        result = copy.copy(self)
+        result.removedChoices = removedChoices
+        result.removedGps = removedGps
+        result.cachedChoices = None
+        result.version = next(versionCounter)
+        return (result, emptyChoices, removedKeys)
+
+    def getRemovals(self):
+        # what this version removed from the shared choice table (picklable without the table, see withRemovals())
+        return (self.removedChoices, self.removedGps, self.version)
+
+    def withRemovals(self, removals):
+        # the version of this (unchanged) var described by getRemovals(), e.g. a var read back from a NodeStore file
+        removedChoices, removedGps, version = removals
+        if version == self.version:
+            return self
+        result = copy.copy(self)
+        result.removedChoices = removedChoices
+        result.removedGps = removedGps
+        result.cachedChoices = None
+        result.version = version
+        return result
 
     def parseName(self):
         satId, tick = self.name.split(".")
@@ -0,0 +1,241 @@
+import bisect
+
+UNMATERIALIZED = object() # VarTable entry whose var isn't created yet
+
+
+class VarTable:
+    # The vars shared by every node of the search, in tick order (var.index = position in vars)
+    #   vars:       Var, None (an event left without choices) or UNMATERIALIZED
+    #   ticks:      tick of each entry, satIndexes: satId -> indexes of the sat's vars in tick order,
+    #   satTicks:   satId -> their ticks (ticks and satTicks are for bisect)
+    # Lazy vars (setLazyVars()): only the (satId, tick) keys are known up front, varFactory(satId, tick) creates a var
+    # (or None) when a frontier first reads it, together with the next vars up to lookaheadTicks later
+    __slots__ = ("vars", "keys", "ticks", "satIndexes", "satTicks", "varFactory", "lookaheadTicks", "materializedCount")
+
+    def __init__(self):
+        self.vars = []
+        self.keys = []       # (satId, tick) of each entry
+        self.ticks = []
+        self.satIndexes = {}
+        self.satTicks = {}
+        self.varFactory = None
+        self.lookaheadTicks = 0
+        self.materializedCount = 0
+
+    def append(self, var):
+        self.addEntry(var.satId, var.tick, var)
+
+    def addEntry(self, satId, tick, var):
+        index = len(self.vars)
+        if var is not None and var is not UNMATERIALIZED:
+            var.index = index
+            self.materializedCount += 1
+        self.vars.append(var)
+        self.keys.append((satId, tick))
+        self.ticks.append(tick)
+        self.satIndexes.setdefault(satId, []).append(index)
+        self.satTicks.setdefault(satId, []).append(tick)
+
+    def sort(self, key=None):
+        # only used for eager vars (before any frontier copy)
+        vars = sorted(self.vars, key=key)
+        self.vars = []
+        self.keys = []
+        self.ticks = []
+        self.satIndexes.clear()
+        self.satTicks.clear()
+        self.materializedCount = 0
+        for var in vars:
+            self.append(var)
+
+    def setLazyVars(self, keys, varFactory, lookaheadTicks=0):
+        # keys: tick-sorted (satId, tick) of the vars
+        for satId, tick in keys:
+            self.addEntry(satId, tick, UNMATERIALIZED)
+        self.varFactory = varFactory
+        self.lookaheadTicks = lookaheadTicks
+
+    def getVar(self, i):
+        var = self.vars[i]
+        if var is UNMATERIALIZED:
+            lastTick = self.keys[i][1] + self.lookaheadTicks
+            var = self.materialize(i)
+            j = i + 1
+            while j < len(self.vars) and self.keys[j][1] <= lastTick:
+                if self.vars[j] is UNMATERIALIZED:
+                    self.materialize(j)
+                j += 1
+        return var
+
+    def materialize(self, i):
+        satId, tick = self.keys[i]
+        var = self.varFactory(satId, tick)
+        if var is not None:
+            var.index = i
+        self.vars[i] = var
+        self.materializedCount += 1
+        return var
+
+
+class VarFrontier:
+    # A node's unassigned vars, shared between nodes instead of copied per child:
+    #   table:   tick-sorted vars shared by every node of the search (see VarTable)
+    #   cursor:  vars before the cursor are assigned or removed
+    #   end:     vars from end on are outside the node's tick window (keepTickRange()), None = no limit
+    #   overlay: var index -> modified var (e.g. choices removed by propagation), or None if the var was removed
+    # copy() costs O(overlay) instead of O(vars), pack() saves a frontier without the table (NodeStore spills open nodes)
+    # Behaves like the old list for reading (len, [0], [-1], in, iteration)
+    # changes go through remove(), replace(), removeVarsUntilTick(), keepTickRange() and clear()
+    # varsInTickRange() and getVarAt() bisect the table's tick lists, iteration is the merged chronological view of all satellites
+    # NOTE: append(), sort() and setLazyVars() change the shared table, they are only used while the root vars are created
+    # NOTE: with lazy vars, len() and full iteration create every var, [0], varsInTickRange() and getVarAt() only what they read
+    __slots__ = ("table", "cursor", "end", "overlay")
+
+    def __init__(self, table=None, cursor=0, overlay=None, end=None):
+        self.table = table if table is not None else VarTable()
+        self.cursor = cursor
+        self.end = end
+        self.overlay = overlay if overlay is not None else {}
+
+    def append(self, var):
+        self.table.append(var)
+
+    def sort(self, key=None):
+        self.table.sort(key)
+
+    def setLazyVars(self, keys, varFactory, lookaheadTicks=0):
+        self.table.setLazyVars(keys, varFactory, lookaheadTicks)
+
+    def copy(self):
+        return VarFrontier(self.table, self.cursor, self.overlay.copy(), self.end)
+
+    def pack(self):
+        # picklable frontier without the shared table (see unpack()), overlay vars are saved as their removals
+        overlay = {i: var if var is None else var.getRemovals() for i, var in self.overlay.items()}
+        return (self.cursor, self.end, overlay)
+
+    def unpack(self, packed):
+        # a frontier of this frontier's table from pack()
+        cursor, end, overlay = packed
+        table = self.table
+        overlay = {i: removals if removals is None else table.vars[i].withRemovals(removals) for i, removals in overlay.items()}
+        return VarFrontier(table, cursor, overlay, end)
+
+    def getVar(self, i):
+        # current var at index i (None if removed)
+        if i in self.overlay:
+            return self.overlay[i]
+        return self.table.getVar(i)
+
+    def remove(self, var):
+        if var not in self:
+            raise ValueError("VarFrontier.remove() var not in frontier: "+str(var))
+        if var.index == self.cursor: # usually the frontier var, no overlay entry needed
+            self.overlay.pop(var.index, None)
+            self.cursor += 1
+        else:
+            self.overlay[var.index] = None
+        self.advanceCursor()
+
+    def replace(self, newVar):
+        # newVar (a modified copy of a current var, same index) takes that var's place
+        if not self.cursor <= newVar.index < self.getEnd() or self.getVar(newVar.index) is None:
+            raise ValueError("VarFrontier.replace() var not in frontier: "+str(newVar))
+        self.overlay[newVar.index] = newVar
+
+    def clear(self):
+        self.cursor = self.getEnd()
+        self.overlay = {}
+
+    def getEnd(self):
+        return len(self.table.vars) if self.end is None else self.end
+
+    def removeVarsUntilTick(self, tick):
+        # removes every var at or before tick (bisect over the tick-sorted table)
+        cursor = max(self.cursor, bisect.bisect_right(self.table.ticks, tick))
+        if cursor > self.cursor:
+            self.overlay = {i: var for i, var in self.overlay.items() if i >= cursor}
+            self.cursor = min(cursor, self.getEnd())
+            self.advanceCursor()
+
+    def keepTickRange(self, startTick, endTick):
+        # removes every var outside [startTick, endTick)
+        self.removeVarsUntilTick(startTick - 1)
+        end = bisect.bisect_left(self.table.ticks, endTick)
+        if end < self.getEnd():
+            self.end = max(end, self.cursor)
+            self.overlay = {i: var for i, var in self.overlay.items() if i < self.end}
+
+    def advanceCursor(self):
+        # moves the cursor past removed vars (their overlay entries aren't needed anymore) and empty events
+        while self.cursor < self.getEnd() and self.getVar(self.cursor) is None:
+            self.overlay.pop(self.cursor, None)
+            self.cursor += 1
+
+    def varsInTickRange(self, startTick, endTick, satId=None):
+        # current vars with startTick <= tick < endTick in tick order, only satId's vars if given
+        # O(log n + k) with bisect over the tick-sorted table
+        # the range starts at the cursor at the earliest (vars before it are assigned or removed)
+        if satId is None:
+            ticks = self.table.ticks
+            indexes = None
+            first = max(bisect.bisect_left(ticks, startTick), self.cursor)
+        else:
+            ticks = self.table.satTicks.get(satId, [])
+            indexes = self.table.satIndexes[satId] if ticks else []
+            first = max(bisect.bisect_left(ticks, startTick), bisect.bisect_left(indexes, self.cursor))
+        end = self.getEnd()
+        for k in range(first, bisect.bisect_left(ticks, endTick)):
+            i = k if indexes is None else indexes[k]
+            if i >= end:
+                break
+            var = self.getVar(i)
+            if var is not None:
+                yield var
+
+    def getVarAt(self, satId, tick):
+        # current var of satId at tick, or None
+        ticks = self.table.satTicks.get(satId)
+        if ticks:
+            k = bisect.bisect_left(ticks, tick)
+            if k < len(ticks) and ticks[k] == tick:
+                i = self.table.satIndexes[satId][k]
+                if self.cursor <= i < self.getEnd():
+                    return self.getVar(i)
+        return None
+
+    def maxLen(self):
+        # len() without creating lazy vars: events not created yet count as vars
+        return self.getEnd() - self.cursor - sum(1 for i, var in self.overlay.items() if var is None and i >= self.cursor)
+
+    def __contains__(self, var):
+        i = getattr(var, "index", None)
+        return i is not None and self.cursor <= i < self.getEnd() and self.getVar(i) is var
+
+    def __len__(self):
+        return sum(1 for var in self)
+
+    def __bool__(self):
+        for var in self:
+            return True
+        return False
+
+    def __iter__(self):
+        for i in range(self.cursor, self.getEnd()):
+            var = self.getVar(i)
+            if var is not None:
+                yield var
+
+    def __reversed__(self):
+        for i in range(self.getEnd() - 1, self.cursor - 1, -1):
+            var = self.getVar(i)
+            if var is not None:
+                yield var
+
+    def __getitem__(self, position):
+        # position among the current vars, only the ends are O(1) (usually [0] or [-1])
+        vars = reversed(self) if position < 0 else iter(self)
+        for i, var in enumerate(vars):
+            if i == (-position - 1 if position < 0 else position):
+                return var
+        raise IndexError("VarFrontier index out of range: "+str(position))